@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import logging
+import os
+import pathlib
+import random
+import re
+import ssl
+import threading
+import time
+import urllib.parse
+from hashlib import md5
+from typing import Any
+
+from .journal import UploadJournal
+from .uploader import _is_throttling
+from .uploader import object_headers
+from .uploader import PendingUpload
+from .uploader import UploadStats
+
+_ERROR_CODE = re.compile(rb'<Code>([^<]+)</Code>')
+
+# seconds to wait for a connection, and for a request to be sent and its response read
+CONNECT_TIMEOUT = 10.0
+READ_TIMEOUT = 60.0
+
+
+class S3RequestError(Exception):
+    """
+    A non-2xx response to a request made by ``AsyncUploader``, with a botocore-style ``response``.
+    """
+
+    def __init__(self, status: int, code: str, body: bytes) -> None:
+        super().__init__(f'{status} {code}: {body[:200]!r}')
+        self.response = {'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}
+
+
+class _Response:
+    def __init__(self, status: int, headers: dict[str, str], body: bytes) -> None:
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class _ConnectionPool:
+    """
+    Keep-alive HTTP/1.1 connections to one host, at most ``max_connections`` of them open at once.
+
+    Connecting and each request/response exchange raise ``TimeoutError`` after ``connect_timeout`` and
+    ``read_timeout`` seconds, closing the connection, so a stalled server fails the attempt instead of
+    holding a connection slot forever.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        use_ssl: bool,
+        max_connections: int,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl.create_default_context() if use_ssl else None
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def _connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        try:
+            return await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self.ssl_context), self.connect_timeout
+            )
+        except TimeoutError as e:
+            raise TimeoutError(f'could not connect to {self.host} within {self.connect_timeout}s') from e
+
+    async def _timed_exchange(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        method: str,
+        target: str,
+        headers: dict[str, str],
+        body: bytes,
+    ) -> _Response:
+        try:
+            return await asyncio.wait_for(
+                self._exchange(reader, writer, method, target, headers, body), self.read_timeout
+            )
+        except TimeoutError as e:
+            raise TimeoutError(f'no response from {self.host} within {self.read_timeout}s') from e
+
+    async def request(self, method: str, target: str, headers: dict[str, str], body: bytes) -> _Response:
+        async with self._slots:
+            if self._idle:
+                reader, writer = self._idle.pop()
+                reused = True
+            else:
+                reader, writer = await self._connect()
+                reused = False
+            try:
+                try:
+                    response = await self._timed_exchange(reader, writer, method, target, headers, body)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    if not reused:
+                        raise
+                    # the server closed an idle connection, retry once on a new one
+                    writer.close()
+                    reader, writer = await self._connect()
+                    response = await self._timed_exchange(reader, writer, method, target, headers, body)
+            except BaseException:
+                writer.close()
+                raise
+            if response.headers.get('connection', '').lower() == 'close':
+                writer.close()
+            else:
+                self._idle.append((reader, writer))
+            return response
+
+    @staticmethod
+    async def _exchange(
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        method: str,
+        target: str,
+        headers: dict[str, str],
+        body: bytes,
+    ) -> _Response:
+        head = [f'{method} {target} HTTP/1.1']
+        head.extend(f'{name}: {value}' for name, value in headers.items())
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        status_line = await reader.readuntil(b'\r\n')
+        status = int(status_line.split(b' ', 2)[1])
+        response_headers: dict[str, str] = {}
+        while (line := await reader.readuntil(b'\r\n')) != b'\r\n':
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while size := int((await reader.readuntil(b'\r\n')).split(b';')[0], 16):
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            await reader.readuntil(b'\r\n')
+            response_body = b''.join(chunks)
+        else:
+            response_body = await reader.readexactly(int(response_headers.get('content-length', 0)))
+        return _Response(status, response_headers, response_body)
+
+    def close(self) -> None:
+        for _reader, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+def _bucket_endpoint(client: Any, bucket_name: str, has_credentials: bool) -> urllib.parse.SplitResult:
+    """
+    The scheme, host and path prefix of the bucket's objects, as botocore addresses them for ``client``: its
+    resolved endpoint (``endpoint_url``, ``AWS_ENDPOINT_URL``, the region) and the virtual-hosted or path
+    style its ``addressing_style`` and the bucket name call for, e.g. path-style for names with dots.
+    """
+    if not has_credentials:
+        # a dry run without credentials cannot presign and sends nothing
+        return urllib.parse.urlsplit(f'{client.meta.endpoint_url}/{bucket_name}')
+    placeholder = 'key'
+    presigned: str = client.generate_presigned_url('put_object', Params={'Bucket': bucket_name, 'Key': placeholder})
+    url = urllib.parse.urlsplit(presigned)
+    path_prefix = url.path.removesuffix(f'/{placeholder}')
+    return url._replace(path=path_prefix, query='', fragment='')
+
+
+class AsyncUploader:
+    """
+    Drop-in alternative to ``Uploader`` running ``concurrency`` uploads on one asyncio event loop.
+
+    Requests are signed with botocore's SigV4 signer and sent over a pool of keep-alive connections, so
+    hundreds of PUTs can be in flight without a thread (and boto3 client) for each. The loop runs in a
+    background thread; ``queue_upload`` blocks while ``concurrency * 4`` items are waiting.
+    """
+
+    def __init__(
+        self,
+        rootdir: str,
+        bucket_name: str,
+        concurrency: int = 256,
+        _dry_run: bool = False,
+        quiet: int = 0,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 30.0,
+        endpoint_url: str | None = None,
+        journal: UploadJournal | None = None,
+        content_encoding: str | None = None,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+    ) -> None:
+        import boto3
+        from botocore.auth import S3SigV4Auth
+
+        self.rootdir = rootdir
+        self.bucket_name = bucket_name
+        self.concurrency = concurrency
+        self._dry_run = _dry_run
+        self.quiet = quiet
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.journal = journal
+        self.content_encoding = content_encoding
+        self.upload_errors: list[tuple[str, str]] = []
+        self.stats = UploadStats()
+
+        session = boto3.Session()
+        client = session.client('s3', endpoint_url=endpoint_url)
+        self._credentials = session.get_credentials()
+        if self._credentials is None and not _dry_run:
+            raise ValueError('no AWS credentials found')
+        self._region: str = client.meta.region_name
+        self._signer_class = S3SigV4Auth
+        endpoint = _bucket_endpoint(client, bucket_name, self._credentials is not None)
+        self._host = endpoint.netloc
+        self._path_prefix = endpoint.path
+        self._base_url = f'{endpoint.scheme}://{self._host}'
+        use_ssl = endpoint.scheme == 'https'
+        port = endpoint.port or (443 if use_ssl else 80)
+        hostname = endpoint.hostname
+        assert hostname is not None
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+        async def start() -> tuple[asyncio.Queue[str | PendingUpload], _ConnectionPool, list[asyncio.Task[None]]]:
+            upload_queue: asyncio.Queue[str | PendingUpload] = asyncio.Queue(maxsize=concurrency * 4)
+            pool = _ConnectionPool(
+                hostname,
+                port,
+                use_ssl,
+                max_connections=concurrency,
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+            )
+            tasks = [asyncio.create_task(self._worker(upload_queue)) for _ in range(concurrency)]
+            return upload_queue, pool, tasks
+
+        self._queue, self._pool, self._tasks = asyncio.run_coroutine_threadsafe(start(), self._loop).result()
+
+    def queue_upload(self, item: str | PendingUpload) -> None:
+        asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop).result()
+
+    def _signed_headers(
+        self, key: str, body: bytes, content_md5: str, object_args: dict[str, str]
+    ) -> tuple[str, dict[str, str]]:
+        from botocore.awsrequest import AWSRequest
+
+        path = f'{self._path_prefix}/{urllib.parse.quote(key, safe="/~")}'
+        headers = {'Content-MD5': content_md5, 'Content-Length': str(len(body))}
+        headers['Content-Type'] = object_args['ContentType']
+        if 'ContentEncoding' in object_args:
+            headers['Content-Encoding'] = object_args['ContentEncoding']
+        request = AWSRequest(method='PUT', url=f'{self._base_url}{path}', data=body, headers=headers)
+        assert self._credentials is not None
+        self._signer_class(self._credentials.get_frozen_credentials(), 's3', self._region).add_auth(request)
+        headers = {'Host': self._host}
+        headers.update((name, str(value)) for name, value in request.headers.items())
+        return path, headers
+
+    async def _put(self, item: str | PendingUpload) -> int:
+        if isinstance(item, PendingUpload):
+            key, body, hexdigest = item.key, item.body, item.md5
+            object_args = object_headers(key, item.content_type, item.content_encoding)
+        else:
+            key = item
+            if self._dry_run:
+                logging.info(f'Uploading {os.path.join(self.rootdir, item)} to s3://{self.bucket_name}/{key}')
+                return 0  # dry runs do not write the files either
+            with open(os.path.join(self.rootdir, item), 'rb') as f:
+                body = f.read()
+            hexdigest = md5(body).hexdigest()
+            object_args = object_headers(key, content_encoding=self.content_encoding)
+        logging.info(f'Uploading {len(body)} bytes to s3://{self.bucket_name}/{key}')
+        if self._dry_run:
+            return len(body)
+        content_md5 = base64.b64encode(bytes.fromhex(hexdigest)).decode('ascii')
+        path, headers = self._signed_headers(key, body, content_md5, object_args)
+        response = await self._pool.request('PUT', path, headers, body)
+        if response.status >= 300:
+            match = _ERROR_CODE.search(response.body)
+            code = match.group(1).decode('ascii') if match else str(response.status)
+            raise S3RequestError(response.status, code, response.body)
+        etag = response.headers.get('etag', '').strip('"')
+        if etag != hexdigest:
+            # expected with SSE-KMS, where the ETag is not the MD5; S3 already checked Content-MD5
+            logging.warning(f'ETag {etag} of {key} does not match MD5 {hexdigest}')
+        return len(body)
+
+    async def _worker(self, upload_queue: asyncio.Queue[str | PendingUpload]) -> None:
+        while True:
+            item = await upload_queue.get()
+            try:
+                await self._upload_with_retries(item)
+            finally:
+                upload_queue.task_done()
+
+    async def _upload_with_retries(self, item: str | PendingUpload) -> None:
+        name = item.key if isinstance(item, PendingUpload) else os.path.join(self.rootdir, item)
+        for attempt in range(self.max_retries + 1):
+            start = time.monotonic()
+            try:
+                size = await self._put(item)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.stats.record_failure()
+                    logging.error(f'Problem uploading {name}', exc_info=True)
+                    self.upload_errors.append((name, str(e)))
+                    return
+                self.stats.record_retry(_is_throttling(e))
+                delay = min(self.backoff_cap, self.backoff_base * 2**attempt) * random.uniform(0.5, 1.0)
+                logging.warning(f'Retrying {name} in {delay:.1f}s after {type(e).__name__}: {e}')
+                await asyncio.sleep(delay)
+            else:
+                self.stats.record_success(time.monotonic() - start, size)
+                if self.journal is not None and isinstance(item, PendingUpload) and not self._dry_run:
+                    self.journal.record(pathlib.PurePosixPath(item.key).stem, item.digest or item.md5)
+                return
+
+    async def _drain(self) -> None:
+        await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._pool.close()
+
+    def join(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._drain(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        if self.quiet < 2:
+            print(f'uploaded {self.stats.report()}')
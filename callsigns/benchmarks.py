@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import logging
+import time
+import tracemalloc
+from hashlib import md5
+from typing import Any
+from typing import Callable
+
+from .hashing import DIGESTS
+from .hashing import get_digest
+from .hashing import HashManifest
+from .parser import parse_all_raw
+from .parser import records_by_call_sign
+from .parser import to_license_records
+from .store import to_record_store
+
+
+def _measure(func: Callable[[], Any]) -> tuple[Any, int, float]:
+    """
+    Returns the result of ``func``, the memory still allocated for it afterwards and the time it took.
+    """
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def bench_store(data_root: str, from_archives: bool = False) -> None:
+    """
+    Compare the memory held by ``to_license_records`` + ``records_by_call_sign`` with ``LicenseRecordStore``.
+
+    Parsing is included in each measurement (and the raw records discarded) so that field strings are
+    counted once for the representation that keeps them alive.
+    """
+
+    def records() -> tuple[dict[str, Any], dict[str, Any]]:
+        license_records = to_license_records(parse_all_raw(data_root, project=True, from_archives=from_archives))
+        return license_records, records_by_call_sign(license_records)
+
+    def store() -> tuple[Any, Any]:
+        record_store = to_record_store(parse_all_raw(data_root, project=True, from_archives=from_archives))
+        return record_store, record_store.by_call_sign()
+
+    for name, func in (('dict of LicenseRecord', records), ('LicenseRecordStore', store)):
+        result, size, elapsed = _measure(func)
+        print(f'{name:<24} {size / 2**20:10.1f} MiB {elapsed:8.2f}s  ({len(result[0])} records)')
+        del result
+
+
+def bench_digest(data_root: str, from_archives: bool = False) -> None:
+    """
+    Per-record cost of serializing and digesting each call sign's records as ``build`` does, for every
+    available digest, plus the size of the resulting hash manifest against the previous JSON format.
+    """
+    license_records = to_license_records(parse_all_raw(data_root, project=True, from_archives=from_archives))
+    payloads = [
+        json.dumps([r.as_dict() for r in records], separators=(',', ':')).encode('utf-8')
+        for records in records_by_call_sign(license_records).values()
+    ]
+    call_signs = list(records_by_call_sign(license_records))
+    print(f'{len(payloads)} call signs')
+
+    start = time.perf_counter()
+    legacy_hashes = {f'_build/callsigns/{cs}.json': md5(p).hexdigest() for cs, p in zip(call_signs, payloads)}
+    elapsed = time.perf_counter() - start
+    legacy_size = len(json.dumps({'created_at': time.time(), 'hashes': legacy_hashes}, separators=(',', ':')))
+    print(f'{"md5 (path keys, json)":<24} {elapsed / len(payloads) * 1e9:8.0f} ns/record {legacy_size:>12} bytes')
+    for name in DIGESTS:
+        try:
+            compute_digest = get_digest(name)
+            compute_digest(b'')
+        except ImportError:
+            print(f'{name:<24} unavailable')
+            continue
+        start = time.perf_counter()
+        hashes = {cs: compute_digest(p) for cs, p in zip(call_signs, payloads)}
+        elapsed = time.perf_counter() - start
+        size = len(HashManifest(algorithm=name, hashes=hashes).dumps())
+        print(f'{name:<24} {elapsed / len(payloads) * 1e9:8.0f} ns/record {size:>12} bytes')
+
+
+def bench_uploader(
+    data_root: str, from_archives: bool = False, limit: int = 20000, threads: int = 32, concurrency: int = 256
+) -> None:
+    """
+    Upload the serialized records of up to ``limit`` call signs with the threaded and the asyncio uploader
+    to a local moto S3 server (``pip install moto[server]``).
+    """
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    from .async_uploader import AsyncUploader
+    from .uploader import PendingUpload
+    from .uploader import Uploader
+
+    license_records = to_license_records(parse_all_raw(data_root, project=True, from_archives=from_archives))
+    items = []
+    for call_sign, records in list(records_by_call_sign(license_records).items())[:limit]:
+        body = json.dumps([r.as_dict() for r in records], separators=(',', ':')).encode('utf-8')
+        items.append(PendingUpload(f'callsigns/{call_sign}.json', body, md5(body).hexdigest()))
+    print(f'{len(items)} objects, {sum(len(item.body) for item in items) / 2**20:.1f} MiB')
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    endpoint_url = f'http://{host}:{port}'
+    client = boto3.client('s3', endpoint_url=endpoint_url)
+    try:
+        uploaders: list[tuple[str, Callable[[str], Uploader | AsyncUploader]]] = [
+            (
+                f'threads ({threads})',
+                lambda bucket: Uploader('', bucket, num_workers=threads, quiet=2, endpoint_url=endpoint_url),
+            ),
+            (
+                f'asyncio ({concurrency})',
+                lambda bucket: AsyncUploader('', bucket, concurrency=concurrency, quiet=2, endpoint_url=endpoint_url),
+            ),
+        ]
+        for index, (name, make_uploader) in enumerate(uploaders):
+            bucket = f'bench-uploader-{index}'
+            client.create_bucket(Bucket=bucket)
+            uploader = make_uploader(bucket)
+            start = time.perf_counter()
+            for item in items:
+                uploader.queue_upload(item)
+            uploader.join()
+            elapsed = time.perf_counter() - start
+            print(f'{name:<24} {elapsed:8.2f}s  {uploader.stats.report()}')
+            sample = items[len(items) // 2]
+            assert client.get_object(Bucket=bucket, Key=sample.key)['Body'].read() == sample.body
+    finally:
+        server.stop()
+
+
+def bench_synthetic(data_root: str, from_archives: bool = False) -> None:
+    """
+    Cost of ``as_dict(include_synthetic=True)`` for every record: recomputing the synthetic fields on each
+    access as the properties used to, through the shared memo, and from ``precompute_synthetics``.
+    """
+    import re
+
+    from .constants import MORSE_TABLE
+    from .constants import PHONETIC_WORDS
+    from .constants import SYLLABLE_LENGTHS
+    from .parser import call_sign_synthetics
+    from .parser import CallSignSynthetics
+    from .parser import precompute_synthetics
+
+    records = list(to_license_records(parse_all_raw(data_root, project=True, from_archives=from_archives)).values())
+    print(f'{len(records)} records, {len({r.call_sign for r in records})} call signs')
+
+    def uncached(call_sign: str) -> CallSignSynthetics:
+        # the previous properties: the Morse string built once per Morse field, an uncompiled pattern
+        match = re.match(r'([A-Z]+)\d([A-Z]+)', call_sign)
+        return CallSignSynthetics(
+            call_sign_morse=' '.join(MORSE_TABLE[c] for c in call_sign),
+            morse_dits=' '.join(MORSE_TABLE[c] for c in call_sign).count('.'),
+            morse_dahs=' '.join(MORSE_TABLE[c] for c in call_sign).count('-'),
+            format=f'{len(match.group(1))}x{len(match.group(2))}' if match else '',
+            phonetic=' '.join(PHONETIC_WORDS[c] for c in call_sign),
+            syllable_length=sum(SYLLABLE_LENGTHS[c] for c in call_sign),
+        )
+
+    def export_uncached() -> None:
+        for r in records:
+            r.as_dict(include_synthetic=True, synthetics={r.call_sign: uncached(r.call_sign)})
+
+    def export_memoized() -> None:
+        call_sign_synthetics.cache_clear()
+        for r in records:
+            r.as_dict(include_synthetic=True)
+
+    def export_precomputed() -> None:
+        synthetics = precompute_synthetics(r.call_sign for r in records)
+        for r in records:
+            r.as_dict(include_synthetic=True, synthetics=synthetics)
+
+    def export_plain() -> None:
+        for r in records:
+            r.as_dict()
+
+    for name, func in (
+        ('without synthetics', export_plain),
+        ('recomputed', export_uncached),
+        ('memoized', export_memoized),
+        ('precomputed', export_precomputed),
+    ):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        print(f'{name:<24} {elapsed / len(records) * 1e9:8.0f} ns/record')
+
+
+def bench_matcher() -> None:
+    """
+    Classify every call sign with a K, Ax or Kx prefix and a one to three letter suffix against
+    ``UNAVAILABLE_PATTERNS``, one regex at a time and with ``UnavailableMatcher``.
+    """
+    import itertools
+    import re
+    import string
+
+    from .constants import UNAVAILABLE_PATTERNS
+    from .vanity import UnavailableMatcher
+
+    letters = string.ascii_uppercase
+    prefixes = ['K'] + [first + second for first in 'AK' for second in letters]
+    suffixes = [''.join(s) for length in (1, 2, 3) for s in itertools.product(letters, repeat=length)]
+    candidates = [f'{prefix}{digit}{suffix}' for prefix in prefixes for digit in string.digits for suffix in suffixes]
+    print(f'{len(candidates)} candidates')
+
+    compiled = [re.compile(pattern) for pattern in UNAVAILABLE_PATTERNS]
+
+    def naive() -> list[int | None]:
+        rules: list[int | None] = []
+        for candidate in candidates:
+            for index, regex in enumerate(compiled):
+                if regex.search(candidate):
+                    rules.append(index)
+                    break
+            else:
+                rules.append(None)
+        return rules
+
+    matcher = UnavailableMatcher()
+
+    def combined() -> list[int | None]:
+        return [rule for _candidate, rule in matcher.classify(candidates)]
+
+    results = []
+    for name, func in (('pattern loop', naive), ('UnavailableMatcher', combined)):
+        start = time.perf_counter()
+        results.append(func())
+        elapsed = time.perf_counter() - start
+        print(f'{name:<24} {elapsed / len(candidates) * 1e9:8.0f} ns/candidate')
+    assert results[0] == results[1]
+    print(f'{sum(rule is not None for rule in results[0])} excluded')
+
+
+def bench_lazy(data_root: str, from_archives: bool = False) -> None:
+    """
+    Time from the record files to the digest of every call sign, as ``build`` computes it: eagerly, with
+    lazy records decoded in full, and with lazy records whose line fingerprints match the previous build's,
+    where nothing but the call signs is decoded.
+    """
+    from .builder import _serialize
+    from .lazy import line_fingerprints
+    from .lazy import parse_all_lines
+    from .lazy import to_lazy_license_records
+
+    compute_digest = get_digest('md5')
+
+    def eager() -> dict[str, str]:
+        license_records = to_license_records(parse_all_raw(data_root, project=True, from_archives=from_archives))
+        return {cs: compute_digest(_serialize(rs)) for cs, rs in records_by_call_sign(license_records).items()}
+
+    def lazy() -> tuple[dict[str, str], dict[str, str]]:
+        lazy_records = to_lazy_license_records(parse_all_lines(data_root, from_archives=from_archives))
+        call_sign_records = records_by_call_sign(lazy_records)
+        fingerprints = line_fingerprints(call_sign_records, compute_digest)
+        return {cs: compute_digest(_serialize(rs)) for cs, rs in call_sign_records.items()}, fingerprints
+
+    hashes, previous_fingerprints = lazy()
+
+    def lazy_unchanged() -> dict[str, str]:
+        lazy_records = to_lazy_license_records(parse_all_lines(data_root, from_archives=from_archives))
+        call_sign_records = records_by_call_sign(lazy_records)
+        fingerprints = line_fingerprints(call_sign_records, compute_digest)
+        return {
+            cs: hashes[cs] if previous_fingerprints.get(cs) == fingerprint else compute_digest(_serialize(rs))
+            for (cs, rs), fingerprint in zip(call_sign_records.items(), fingerprints.values())
+        }
+
+    results = []
+    for name, func in (('eager', eager), ('lazy', lambda: lazy()[0]), ('lazy, unchanged lines', lazy_unchanged)):
+        start = time.perf_counter()
+        results.append(func())
+        elapsed = time.perf_counter() - start
+        print(f'{name:<24} {elapsed:8.2f}s  ({len(results[-1])} call signs)')
+    assert results[0] == results[1] == results[2]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='micro-benchmarks against a local ULS data directory')
+    parser.add_argument('benchmark', choices=['store', 'digest', 'uploader', 'synthetic', 'matcher', 'lazy'])
+    parser.add_argument('--data-root', default='callsign_data')
+    parser.add_argument('--from-archives', action='store_true', default=False)
+    args = parser.parse_args()
+    if args.benchmark == 'store':
+        bench_store(args.data_root, from_archives=args.from_archives)
+    elif args.benchmark == 'digest':
+        bench_digest(args.data_root, from_archives=args.from_archives)
+    elif args.benchmark == 'synthetic':
+        bench_synthetic(args.data_root, from_archives=args.from_archives)
+    elif args.benchmark == 'matcher':
+        bench_matcher()
+    elif args.benchmark == 'lazy':
+        bench_lazy(args.data_root, from_archives=args.from_archives)
+    elif args.benchmark == 'uploader':
+        bench_uploader(args.data_root, from_archives=args.from_archives)
+
+
+if __name__ == '__main__':
+    main()
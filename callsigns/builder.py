@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import collections
+import concurrent.futures
 import copy
 import datetime
 import json
@@ -7,16 +9,69 @@ import os
 import pathlib
 import re
 import tempfile
-import time
 from hashlib import md5
+from itertools import islice
+from typing import Any
+from typing import Callable
 from typing import Generator
+from typing import Iterable
+from typing import Iterator
+from typing import Mapping
+from typing import Sequence
 
+from callsigns.async_uploader import AsyncUploader
+from callsigns.cache import load_cached_records
+from callsigns.cache import records_cache_key
+from callsigns.cache import save_cached_records
+from callsigns.changes import add_to_feed_index
+from callsigns.changes import diff_hashes
+from callsigns.changes import dumps_change_feed
+from callsigns.changes import FEED_INDEX
+from callsigns.changes import filter_change_feed
+from callsigns.changes import load_feed_index
+from callsigns.changes import write_change_feed
+from callsigns.compression import compress
+from callsigns.compression import COMPRESSIONS
+from callsigns.compression import content_type
+from callsigns.compression import manifest_algorithm
+from callsigns.expirations import ExpirationIndex
+from callsigns.fetcher import _get_data_dir_date
 from callsigns.fetcher import fetch_and_extract_all
+from callsigns.hashing import DEFAULT_DIGEST
+from callsigns.hashing import DIGESTS
+from callsigns.hashing import get_digest
+from callsigns.hashing import HashManifest
+from callsigns.hashing import split_shards
+from callsigns.journal import fold_journal
+from callsigns.journal import UploadJournal
+from callsigns.lazy import LazyLicenseRecord
+from callsigns.lazy import line_fingerprint_algorithm
+from callsigns.lazy import line_fingerprints
+from callsigns.lazy import parse_all_lines
+from callsigns.lazy import to_lazy_license_records
+from callsigns.packs import pack_key
+from callsigns.packs import PACK_LAYOUTS
+from callsigns.packs import pack_name
+from callsigns.packs import pack_records
+from callsigns.packs import PACKS_DIR
+from callsigns.parser import get_included_sources
+from callsigns.parser import LicenseRecord
 from callsigns.parser import parse_all_raw
+from callsigns.parser import process_pool_context
 from callsigns.parser import records_by_call_sign
 from callsigns.parser import to_license_records
+from callsigns.snapshot import save_snapshot
+from callsigns.snapshot import update_snapshot
+from callsigns.store import LicenseRecordStore
+from callsigns.store import to_record_store
+from callsigns.uploader import PendingUpload
 from callsigns.uploader import Uploader
 
+WRITE_WORKERS = 8
+SERIALIZE_CHUNK_SIZE = 256
+
+_CALL_SIGN_PARTS = re.compile(r'([A-Z]+)(\d)[A-Z]+')
+
 
 def build(
     rootdir: str = '_build',
@@ -25,19 +80,122 @@ def build(
     quiet: int = 0,
     hash_file: str | None = None,
     remote_hashes: dict[str, str] | None = None,
-) -> Generator[str, None, None]:
+    from_archives: bool = False,
+    snapshot_file: str | None = None,
+    parse_workers: int | None = None,
+    compact_records: bool = False,
+    lazy_records: bool = False,
+    records_cache: str | None = None,
+    digest: str = DEFAULT_DIGEST,
+    payloads: bool = False,
+    write_local: bool = True,
+    expiration_index: str | None = None,
+    pack_layout: str | None = None,
+    serialize_workers: int | None = None,
+    compression: str | None = None,
+    change_feed: bool = False,
+) -> Generator[str | PendingUpload, None, None]:
+    """
+    Build the per-call-sign JSON files and yield the key of each one that needs to be uploaded.
+
+    With ``payloads=True``, ``PendingUpload`` items carrying the serialized bytes and their MD5 are yielded
+    instead, so they can be uploaded without reading the files back; ``write_local=False`` then also skips
+    writing the local mirror under ``rootdir``.
+
+    With ``expiration_index``, an ``ExpirationIndex`` of the parsed records is saved to that file.
+
+    With a ``pack_layout`` from ``PACK_LAYOUTS``, call signs are written grouped into packs (see
+    ``pack_records``) instead of one file each, and the keys of the changed packs are yielded. The pack
+    digests are kept in ``pack-hashes.bin`` next to ``hash_file``, and ``remote_hashes`` is then keyed by
+    pack name.
+
+    With ``lazy_records``, a fingerprint of each call sign's raw record lines is kept in ``line-hashes.bin``
+    next to ``hash_file``, and call signs whose lines did not change since the build that wrote the local
+    hashes are not decoded or serialized again.
+
+    With ``serialize_workers`` greater than one, records are serialized and hashed in that many processes
+    and files are written by a pool of ``WRITE_WORKERS`` threads, while keys keep being yielded as each
+    call sign is done.
+
+    With a ``compression`` from ``COMPRESSIONS``, objects are compressed once here and published with that
+    ``Content-Encoding``; the local mirror holds them compressed as well. Digests are still computed over
+    the uncompressed objects, under the algorithm ``manifest_algorithm`` names.
+
+    With ``change_feed``, the call signs that are new, changed or removed since the previous hashes are
+    written as a change feed under ``rootdir / CHANGES_DIR`` (see ``dumps_change_feed``). The previous
+    hashes are ``remote_hashes`` when given, or else the local ones, except with a ``pack_layout``, where they
+    are always the local ones.
+    """
+    if not write_local and not payloads:
+        raise ValueError('the local mirror can only be skipped when uploading payloads')
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError(f'unknown compression {compression!r}, expected one of {COMPRESSIONS}')
+    if pack_layout is not None and pack_layout not in PACK_LAYOUTS:
+        raise ValueError(f'unknown pack layout {pack_layout!r}, expected one of {PACK_LAYOUTS}')
+    if lazy_records and (snapshot_file is not None or compact_records):
+        raise ValueError('lazy records cannot be combined with a snapshot or compact records')
+    if records_cache is not None and (lazy_records or snapshot_file is not None):
+        raise ValueError('the records cache cannot be combined with lazy records or a snapshot')
     if quiet < 2:
         print('fetching...')
-    fetch_and_extract_all()
-    if quiet < 2:
-        print('parsing...')
-    raw_records = parse_all_raw()
-    if quiet < 2:
+    fetch_and_extract_all(extract=not from_archives)
+    cached_records: dict[str, LicenseRecord] | None = None
+    if records_cache is not None:
+        cache_key = records_cache_key(get_included_sources(from_archives=from_archives))
+        cached_records = load_cached_records(records_cache, cache_key)
+        if quiet < 2 and cached_records is not None:
+            print('loaded records from cache...')
+    changed_call_signs: set[str] | None = None
+    if cached_records is not None:
+        pass
+    elif lazy_records:
+        if quiet < 2:
+            print('parsing...')
+        raw_lines = parse_all_lines(from_archives=from_archives)
+    elif snapshot_file is not None:
+        if quiet < 2:
+            print('parsing...')
+        snapshot, changed_call_signs = update_snapshot(
+            snapshot_file, from_archives=from_archives, workers=parse_workers
+        )
+        raw_records = snapshot.records_by_usi
+        if quiet < 2 and changed_call_signs is not None:
+            print(f'{len(changed_call_signs)} call signs changed since the last snapshot')
+    else:
+        if quiet < 2:
+            print('parsing...')
+        raw_records = parse_all_raw(project=True, from_archives=from_archives, workers=parse_workers)
+    if quiet < 2 and cached_records is None:
         print('converting records...')
-    license_records = to_license_records(raw_records)
-    if quiet < 2:
-        print('sorting...')
-    call_sign_records = records_by_call_sign(license_records)
+    call_sign_records: Mapping[str, Sequence[LicenseRecord | LazyLicenseRecord]]
+    line_hashes: dict[str, str] | None = None
+    if lazy_records:
+        lazy_license_records = to_lazy_license_records(raw_lines)
+        if quiet < 2:
+            print('sorting...')
+        lazy_call_sign_records = records_by_call_sign(lazy_license_records)
+        line_hashes = line_fingerprints(lazy_call_sign_records, get_digest(digest))
+        call_sign_records = lazy_call_sign_records
+    elif compact_records:
+        if cached_records is not None:
+            record_store = LicenseRecordStore.from_records(cached_records.items())
+        else:
+            record_store = to_record_store(raw_records)
+            if records_cache is not None:
+                save_cached_records(records_cache, cache_key, record_store)
+        if quiet < 2:
+            print('sorting...')
+        call_sign_records = record_store.by_call_sign()
+    else:
+        if cached_records is not None:
+            license_records = cached_records
+        else:
+            license_records = to_license_records(raw_records)
+            if records_cache is not None:
+                save_cached_records(records_cache, cache_key, license_records)
+        if quiet < 2:
+            print('sorting...')
+        call_sign_records = records_by_call_sign(license_records)
     callsign_dir = os.path.join(rootdir, 'callsigns')
     if not os.path.exists(rootdir):
         os.mkdir(rootdir)
@@ -51,96 +209,477 @@ def build(
     to_sync = 0
     new = 0
 
+    algorithm = manifest_algorithm(digest, compression, _key_layout(flat, pack_layout))
+    # what consumers of the change feed last saw, when known; the local hashes may list objects that failed to upload
+    published_record_hashes = remote_hashes if remote_hashes is not None and pack_layout is None else None
     if remote_hashes is None:
         remote_hashes = {}
-    if hash_file is not None:
-        if os.path.isfile(hash_file):
-            with open(hash_file, encoding='utf-8') as f:
-                hash_data = json.load(f)
-                local_record_hashes = hash_data['hashes']
-        else:
-            local_record_hashes = copy.copy(remote_hashes)
-    else:
-        hash_file = os.path.join(rootdir, 'hashes.json')
-        local_record_hashes = copy.copy(remote_hashes)
-    current_record_hashes = {}
+    if hash_file is None:
+        hash_file = os.path.join(rootdir, 'hashes.bin')
+    line_hash_file = os.path.join(os.path.dirname(hash_file), 'line-hashes.bin')
+    local_record_hashes: dict[str, str] | None = None
+    if os.path.isfile(hash_file):
+        local_manifest = HashManifest.load(hash_file)
+        if local_manifest.algorithm == algorithm:
+            local_record_hashes = local_manifest.hashes
+            if line_hashes is not None and os.path.isfile(line_hash_file):
+                # only comparable when written by the same build as the local hashes
+                line_manifest = HashManifest.load(line_hash_file)
+                if (
+                    line_manifest.algorithm == line_fingerprint_algorithm(algorithm)
+                    and line_manifest.created_at == local_manifest.created_at
+                ):
+                    previous_line_hashes = line_manifest.hashes
+                    changed_call_signs = {
+                        callsign
+                        for callsign, line_hash in line_hashes.items()
+                        if previous_line_hashes.get(callsign) != line_hash
+                    }
+                    if quiet < 2:
+                        print(f'{len(changed_call_signs)} call signs changed since the last build')
+        elif quiet < 2:
+            print(f'ignoring local hashes computed with {local_manifest.algorithm}')
+    if local_record_hashes is None:
+        local_record_hashes = copy.copy(remote_hashes) if pack_layout is None else {}
+        changed_call_signs = None  # no local hashes for the snapshot's previous state
+    current_record_hashes: dict[str, str] = {}
+    pack_hash_file = os.path.join(os.path.dirname(hash_file), 'pack-hashes.bin')
+    current_pack_hashes: dict[str, str] = {}
+    if pack_layout is not None:
+        local_pack_hashes = copy.copy(remote_hashes)
+        if os.path.isfile(pack_hash_file):
+            local_pack_manifest = HashManifest.load(pack_hash_file)
+            if local_pack_manifest.algorithm == algorithm:
+                local_pack_hashes = local_pack_manifest.hashes
+        counts = yield from _build_packs(
+            rootdir,
+            call_sign_records,
+            pack_layout,
+            local_record_hashes,
+            local_pack_hashes,
+            remote_hashes,
+            changed_call_signs,
+            current_record_hashes,
+            current_pack_hashes,
+            digest,
+            compression,
+            dry_run=dry_run,
+            quiet=quiet,
+            payloads=payloads,
+            write_local=write_local,
+        )
+        skipped, changed, new, to_sync = counts
     # to_upload = []
-    for index, (callsign, records) in enumerate(call_sign_records.items(), start=1):
+    call_sign_items: Iterable[tuple[str, Sequence[LicenseRecord | LazyLicenseRecord]]] = (
+        call_sign_records.items() if pack_layout is None else ()  # already written to packs
+    )
+
+    def is_unchanged(callsign: str) -> bool:
+        # unchanged since the snapshot the local hashes were built from, no need to serialize it again
+        return changed_call_signs is not None and callsign not in changed_call_signs and callsign in local_record_hashes
+
+    serialized = _serialize_all(call_sign_items, is_unchanged, digest, compression, workers=serialize_workers)
+    writer = _FileWriter(WRITE_WORKERS if serialize_workers is not None and serialize_workers > 1 else 0)
+    created_dirs: set[str] = set()
+    for index, (callsign, records, out_bytes, new_digest) in enumerate(serialized, start=1):
         if not quiet and (index % 100 == 0 or index == num_records):
             print(f'Processing {index}/{num_records} {skipped=} {changed=} {new=} {to_sync=}          ', end='\r')
         if not flat:
-            pattern = r'([A-Z]+)(\d)[A-Z]+'
-            match = re.match(pattern, callsign)
+            match = _CALL_SIGN_PARTS.match(callsign)
             if not match:
                 print(f'could not parse callsign {callsign!r} {records!r}')
                 continue
             call_prefix, region_num = match.groups()
             callsign_subdir = os.path.join(callsign_dir, region_num, call_prefix)
-            if not os.path.exists(callsign_subdir):
-                os.makedirs(callsign_subdir)
+            if write_local and callsign_subdir not in created_dirs:
+                os.makedirs(callsign_subdir, exist_ok=True)
+                created_dirs.add(callsign_subdir)
             fp = pathlib.Path(os.path.join(callsign_subdir, f'{callsign}.json')).as_posix()
         else:
             fp = pathlib.Path(os.path.join(callsign_dir, f'{callsign}.json')).as_posix()
-        formatted = [r.as_dict() for r in records]
-        out_bytes = json.dumps(formatted, separators=(',', ':')).encode('utf-8')
-        out_digest = md5(out_bytes).hexdigest()
-        current_record_hashes[fp] = out_digest
-        if fp in local_record_hashes:
-            existing_digest = local_record_hashes[fp]
-
-            if existing_digest == out_digest:
-                if remote_hashes.get(fp) != existing_digest:
-                    # assert pathlib.Path(fp).relative_to(rootdir).as_posix() == fp
-                    # to_upload.append(pathlib.Path(fp).relative_to(rootdir).as_posix())
-                    yield pathlib.Path(fp).relative_to(rootdir).as_posix()
-                    to_sync += 1
-                    continue
-                else:
-                    skipped += 1
-                    continue
-        if os.path.exists(fp):
-            exists = True
-            with open(fp, 'rb') as f:
-                data = f.read()
-            existing_digest = md5(data).hexdigest()
-            if existing_digest == out_digest:
-                if remote_hashes.get(fp) != existing_digest:
-                    # to_upload.append(pathlib.Path(fp).relative_to(rootdir).as_posix())
-                    yield pathlib.Path(fp).relative_to(rootdir).as_posix()
-                    to_sync += 1
-                    continue
+        key = pathlib.Path(fp).relative_to(rootdir).as_posix()
+        existing_digest = local_record_hashes.get(callsign)
+        out_digest = new_digest if new_digest is not None else local_record_hashes[callsign]
+        current_record_hashes[callsign] = out_digest
+        if existing_digest == out_digest:
+            if remote_hashes.get(callsign) != existing_digest:
+                if payloads:
+                    if out_bytes is None:
+                        out_bytes = _encode(_serialize(records), compression)
+                    yield _pending_upload(key, out_bytes, out_digest, digest, compression)
                 else:
-                    skipped += 1
-                    continue
-        else:
-            exists = False
+                    yield key
+                to_sync += 1
+            else:
+                skipped += 1
+            continue
+        assert out_bytes is not None
 
-        if not dry_run:
-            with open(fp, 'wb') as f:
-                f.write(out_bytes)
-        if exists:
+        if existing_digest is not None:
             changed += 1
         else:
             new += 1
         #         to_upload.append(pathlib.Path(fp).relative_to(rootdir).as_posix())
-        yield pathlib.Path(fp).relative_to(rootdir).as_posix()
+        if payloads:
+            if not dry_run and write_local:
+                writer.write(fp, out_bytes)
+            yield _pending_upload(key, out_bytes, out_digest, digest, compression)
+        elif not dry_run and write_local:
+            # the uploader reads the file back, so its key is only yielded once it is written
+            yield from writer.write(fp, out_bytes, key)
+        else:
+            yield key
+    yield from writer.close()
 
     if not dry_run:
-        # todo: make this atomic
-        hashdata = {'created_at': time.time(), 'hashes': current_record_hashes}
-        with open(hash_file, 'w', encoding='utf-8') as hfile:
-            json.dump(hashdata, hfile, separators=(',', ':'))
+        manifest = HashManifest(algorithm=algorithm, hashes=current_record_hashes)
+        manifest.save(hash_file)
+        if line_hashes is not None:
+            line_manifest = HashManifest(algorithm=line_fingerprint_algorithm(algorithm), hashes=line_hashes)
+            line_manifest.created_at = manifest.created_at
+            line_manifest.save(line_hash_file)
+        if pack_layout is not None:
+            HashManifest(algorithm=algorithm, hashes=current_pack_hashes).save(pack_hash_file)
+        if snapshot_file is not None:
+            save_snapshot(snapshot, snapshot_file)
+        if expiration_index is not None:
+            ExpirationIndex.from_call_sign_records(call_sign_records).save(expiration_index)
+        previous_record_hashes = local_record_hashes if published_record_hashes is None else published_record_hashes
+        changes = diff_hashes(previous_record_hashes, current_record_hashes) if change_feed else []
+        if changes:
+            sources = get_included_sources(from_archives=from_archives)
+            source_date = max(_get_data_dir_date(source) for source in sources).isoformat() if sources else None
+            header, feed = dumps_change_feed(
+                changes,
+                lambda callsign: _object_key(callsign, flat, pack_layout),
+                manifest.created_at,
+                algorithm,
+                source_date,
+            )
+            write_change_feed(rootdir, header, feed)
+            if quiet < 2:
+                print(
+                    f'change feed {header["key"]}: new={header["new"]} changed={header["changed"]} '
+                    f'removed={header["removed"]}'
+                )
     if quiet < 2:
-        print(f'{num_records} records processed. {skipped=} {changed=} {new=} synced={to_sync}           ')
+        units = 'records' if pack_layout is None else f'records in {len(current_pack_hashes)} packs'
+        print(f'{num_records} {units} processed. {skipped=} {changed=} {new=} synced={to_sync}           ')
 
     # return to_upload, hash_file
 
 
-def _get_remote_hashes(bucket: str, key: str = 'hashes.json') -> dict[str, str] | None:
-    # TODO: [de]compress remote hash file
+def _key_layout(flat: bool, pack_layout: str | None) -> str | None:
+    """
+    The layout tag of ``manifest_algorithm``: hashes are keyed by call sign in every layout, so the layout
+    has to be part of the algorithm for a switch to publish the objects under their new keys.
+    """
+    if pack_layout is not None:
+        return f'packs-{pack_layout}'
+    return None if flat else 'nested'
+
+
+def _object_key(callsign: str, flat: bool, pack_layout: str | None) -> str | None:
+    """
+    The key of the object ``build`` publishes a call sign in, or ``None`` if it has none.
+    """
+    if pack_layout is not None:
+        return pack_key(pack_name(callsign, pack_layout))
+    if flat:
+        return f'callsigns/{callsign}.json'
+    match = _CALL_SIGN_PARTS.match(callsign)
+    if not match:
+        return None
+    call_prefix, region_num = match.groups()
+    return f'callsigns/{region_num}/{call_prefix}/{callsign}.json'
+
+
+def _build_packs(
+    rootdir: str,
+    call_sign_records: Mapping[str, Sequence[LicenseRecord | LazyLicenseRecord]],
+    layout: str,
+    local_record_hashes: dict[str, str],
+    local_pack_hashes: dict[str, str],
+    remote_hashes: dict[str, str],
+    changed_call_signs: set[str] | None,
+    current_record_hashes: dict[str, str],
+    current_pack_hashes: dict[str, str],
+    digest: str,
+    compression: str | None,
+    dry_run: bool,
+    quiet: int,
+    payloads: bool,
+    write_local: bool,
+) -> Generator[str | PendingUpload, None, tuple[int, int, int, int]]:
+    """
+    The pack layout of ``build``: packs are only serialized again when one of their call signs changed,
+    or one was added or removed, and only packs that differ from the remote ones are yielded.
+    Returns the ``skipped, changed, new, to_sync`` counts of packs.
+    """
+    compute_digest = get_digest(digest)
+    pack_members: dict[str, list[str]] = {}
+    for callsign in call_sign_records:
+        pack_members.setdefault(pack_name(callsign, layout), []).append(callsign)
+    previous_members: dict[str, set[str]] = {}
+    for callsign in local_record_hashes:
+        previous_members.setdefault(pack_name(callsign, layout), set()).add(callsign)
+    pack_dir = os.path.join(rootdir, PACKS_DIR)
+    if write_local and not os.path.exists(pack_dir):
+        os.mkdir(pack_dir)
+    skipped = 0
+    changed = 0
+    new = 0
+    to_sync = 0
+    num_packs = len(pack_members)
+    for index, (name, members) in enumerate(sorted(pack_members.items()), start=1):
+        if not quiet:
+            print(f'Processing pack {index}/{num_packs} {skipped=} {changed=} {new=} {to_sync=}          ', end='\r')
+        members.sort()
+        bodies: dict[str, bytes] = {}
+        members_changed = previous_members.get(name) != set(members)
+        for callsign in members:
+            existing_digest = local_record_hashes.get(callsign)
+            if changed_call_signs is not None and callsign not in changed_call_signs and existing_digest is not None:
+                current_record_hashes[callsign] = existing_digest
+                continue
+            body = _serialize(call_sign_records[callsign])
+            body_digest = compute_digest(body)
+            current_record_hashes[callsign] = body_digest
+            bodies[callsign] = body
+            if body_digest != existing_digest:
+                members_changed = True
+        key = pack_key(name)
+        existing_digest = local_pack_hashes.get(name)
+        out_bytes: bytes | None = None
+        if members_changed or existing_digest is None:
+            out_bytes = _pack(members, bodies, call_sign_records)
+            out_digest = compute_digest(out_bytes)
+        else:
+            out_digest = existing_digest
+        current_pack_hashes[name] = out_digest
+        if existing_digest == out_digest:
+            if remote_hashes.get(name) != existing_digest:
+                if payloads:
+                    if out_bytes is None:
+                        out_bytes = _pack(members, bodies, call_sign_records)
+                    yield _pending_upload(key, _encode(out_bytes, compression), out_digest, digest, compression)
+                else:
+                    yield key
+                to_sync += 1
+            else:
+                skipped += 1
+            continue
+        assert out_bytes is not None
+
+        out_bytes = _encode(out_bytes, compression)
+        if not dry_run and write_local:
+            with open(os.path.join(rootdir, key), 'wb') as f:
+                f.write(out_bytes)
+        if existing_digest is not None:
+            changed += 1
+        else:
+            new += 1
+        if payloads:
+            yield _pending_upload(key, out_bytes, out_digest, digest, compression)
+        else:
+            yield key
+    return skipped, changed, new, to_sync
+
+
+def _pack(
+    members: list[str],
+    bodies: dict[str, bytes],
+    call_sign_records: Mapping[str, Sequence[LicenseRecord | LazyLicenseRecord]],
+) -> bytes:
+    return pack_records(
+        (callsign, bodies.get(callsign) or _serialize(call_sign_records[callsign])) for callsign in members
+    )
+
+
+def _serialize_chunk(
+    chunk: list[Sequence[LicenseRecord | LazyLicenseRecord]], digest: str, compression: str | None
+) -> list[tuple[bytes, str]]:
+    compute_digest = get_digest(digest)
+    results = []
+    for records in chunk:
+        out_bytes = _serialize(records)
+        results.append((_encode(out_bytes, compression), compute_digest(out_bytes)))
+    return results
+
+
+def _serialize_all(
+    items: Iterable[tuple[str, Sequence[LicenseRecord | LazyLicenseRecord]]],
+    is_unchanged: Callable[[str], bool],
+    digest: str,
+    compression: str | None = None,
+    workers: int | None = None,
+    chunk_size: int = SERIALIZE_CHUNK_SIZE,
+) -> Iterator[tuple[str, Sequence[LicenseRecord | LazyLicenseRecord], bytes | None, str | None]]:
+    """
+    Yield every call sign and its records with their serialization, compressed with ``compression``, and
+    the digest of the uncompressed serialization, or ``None`` for both when ``is_unchanged``.
+
+    With ``workers`` greater than one, chunks of ``chunk_size`` call signs are serialized in a process pool,
+    at most ``workers * 2`` chunks ahead of the consumer, and still yielded in order.
+    """
+    if workers is None or workers <= 1:
+        compute_digest = get_digest(digest)
+        for callsign, records in items:
+            if is_unchanged(callsign):
+                yield callsign, records, None, None
+                continue
+            out_bytes = _serialize(records)
+            yield callsign, records, _encode(out_bytes, compression), compute_digest(out_bytes)
+        return
+    iterator = iter(items)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=process_pool_context()) as executor:
+        pending: collections.deque[
+            tuple[
+                list[tuple[str, Sequence[LicenseRecord | LazyLicenseRecord], bool]],
+                concurrent.futures.Future[list[tuple[bytes, str]]],
+            ]
+        ] = collections.deque()
+        while chunk := [
+            (callsign, records, is_unchanged(callsign)) for callsign, records in islice(iterator, chunk_size)
+        ]:
+            to_serialize = [records for _callsign, records, unchanged in chunk if not unchanged]
+            pending.append((chunk, executor.submit(_serialize_chunk, to_serialize, digest, compression)))
+            if len(pending) > workers * 2:
+                yield from _chunk_results(*pending.popleft())
+        while pending:
+            yield from _chunk_results(*pending.popleft())
+
+
+def _chunk_results(
+    chunk: list[tuple[str, Sequence[LicenseRecord | LazyLicenseRecord], bool]],
+    future: concurrent.futures.Future[list[tuple[bytes, str]]],
+) -> Iterator[tuple[str, Sequence[LicenseRecord | LazyLicenseRecord], bytes | None, str | None]]:
+    results = iter(future.result())
+    for callsign, records, unchanged in chunk:
+        if unchanged:
+            yield callsign, records, None, None
+        else:
+            out_bytes, out_digest = next(results)
+            yield callsign, records, out_bytes, out_digest
+
+
+def _write_file(filename: str, data: bytes) -> None:
+    with open(filename, 'wb') as f:
+        f.write(data)
+
+
+class _FileWriter:
+    """
+    Writes files on a pool of ``workers`` threads, or right away with ``workers=0``.
+
+    ``write`` and ``close`` return the items given with the writes that have finished, in order, so they can
+    be passed on once their file exists. At most ``workers * 64`` writes are left pending.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self._executor = concurrent.futures.ThreadPoolExecutor(workers) if workers else None
+        self._pending: collections.deque[tuple[concurrent.futures.Future[None], str | None]] = collections.deque()
+        self._max_pending = workers * 64
+
+    def write(self, filename: str, data: bytes, item: str | None = None) -> list[str]:
+        if self._executor is None:
+            _write_file(filename, data)
+            return [item] if item is not None else []
+        self._pending.append((self._executor.submit(_write_file, filename, data), item))
+        return self._finished(self._max_pending)
+
+    def _finished(self, max_pending: int) -> list[str]:
+        done = []
+        while self._pending and (self._pending[0][0].done() or len(self._pending) > max_pending):
+            future, item = self._pending.popleft()
+            future.result()
+            if item is not None:
+                done.append(item)
+        return done
+
+    def close(self) -> list[str]:
+        done = self._finished(0)
+        if self._executor is not None:
+            self._executor.shutdown()
+        return done
+
+
+def _encode(out_bytes: bytes, compression: str | None) -> bytes:
+    return compress(out_bytes, compression) if compression is not None else out_bytes
+
+
+def _pending_upload(
+    key: str, out_bytes: bytes, out_digest: str, digest: str, compression: str | None = None
+) -> PendingUpload:
+    # the digest is of the uncompressed object, so it is only the MD5 of the body when that is not compressed
+    body_md5 = out_digest if digest == 'md5' and compression is None else md5(out_bytes).hexdigest()
+    return PendingUpload(key, out_bytes, body_md5, out_digest, content_type(key), compression)
+
+
+def _serialize(records: Sequence[LicenseRecord | LazyLicenseRecord]) -> bytes:
+    formatted = [r.as_dict() for r in records]
+    return json.dumps(formatted, separators=(',', ':')).encode('utf-8')
+
+
+REMOTE_HASHES_PREFIX = 'hashes/'
+REMOTE_PACK_HASHES_PREFIX = 'pack-hashes/'
+
+
+def _get_remote_hashes(
+    bucket: str, cache_dir: str, prefix: str = REMOTE_HASHES_PREFIX, endpoint_url: str | None = None
+) -> tuple[HashManifest, dict[str, Any]] | None:
+    """
+    Retrieve the sharded remote hash manifest and its index. Shards already in ``cache_dir`` with the digest
+    recorded in the index are not downloaded again.
+    """
     import boto3
 
-    client = boto3.client('s3')
+    client = boto3.client('s3', endpoint_url=endpoint_url)
+    try:
+        index_object = client.get_object(Bucket=bucket, Key=f'{prefix}index.json')
+    except client.exceptions.NoSuchKey:
+        # not migrated to the sharded layout yet
+        legacy_manifest = _get_legacy_remote_hashes(bucket, endpoint_url=endpoint_url)
+        if legacy_manifest is None:
+            return None
+        return legacy_manifest, {}
+    except Exception as e:
+        print(e)
+        return None
+    index: dict[str, Any] = json.loads(index_object['Body'].read())
+    os.makedirs(cache_dir, exist_ok=True)
+    hashes: dict[str, str] = {}
+    downloaded = 0
+    try:
+        for shard, shard_info in index['shards'].items():
+            cached_shard = os.path.join(cache_dir, f'{shard}.bin')
+            data = None
+            if os.path.isfile(cached_shard):
+                with open(cached_shard, 'rb') as f:
+                    data = f.read()
+                if md5(data).hexdigest() != shard_info['digest']:
+                    data = None
+            if data is None:
+                data = client.get_object(Bucket=bucket, Key=shard_info['key'])['Body'].read()
+                downloaded += 1
+                with open(cached_shard, 'wb') as f:
+                    f.write(data)
+            hashes.update(HashManifest.loads(data).hashes)
+    except Exception as e:
+        print(e)
+        return None
+    print(f'{downloaded} of {len(index["shards"])} hash shards downloaded')
+    manifest = HashManifest(algorithm=index['algorithm'], hashes=hashes)
+    manifest.created_at = index['created_at']
+    return manifest, index
+
+
+def _get_legacy_remote_hashes(
+    bucket: str, key: str = 'hashes.json', endpoint_url: str | None = None
+) -> HashManifest | None:
+    import boto3
+
+    client = boto3.client('s3', endpoint_url=endpoint_url)
     with tempfile.TemporaryDirectory(prefix='callsigns-temp', ignore_cleanup_errors=True) as d:
         tempfilename = f'{d}/remote-hashes.json'
         try:
@@ -148,27 +687,146 @@ def _get_remote_hashes(bucket: str, key: str = 'hashes.json') -> dict[str, str]
         except Exception as e:
             print(e)
             return None
-        with open(tempfilename, 'r', encoding='utf-8') as f:
-            remote_hash_data = json.load(f)['hashes']
-            assert isinstance(remote_hash_data, dict)
-        return remote_hash_data
+        return HashManifest.load(tempfilename)
 
 
-def _update_hashes_to_remote(local_hash_file: str, bucket: str, key: str = 'hashes.json') -> None:
+def _update_hashes_to_remote(
+    manifest: HashManifest,
+    bucket: str,
+    cache_dir: str,
+    remote_index: dict[str, Any] | None = None,
+    prefix: str = REMOTE_HASHES_PREFIX,
+    endpoint_url: str | None = None,
+) -> bool:
+    """
+    Publish a hash manifest as compressed shards plus an index. Only shards whose contents differ
+    from the ones in ``remote_index`` are uploaded. Shard keys include their digest and the index is written
+    last, so readers never see an index referring to a partially written shard.
+    Returns whether the new index was written.
+    """
     import boto3
 
-    client = boto3.client('s3')
+    client = boto3.client('s3', endpoint_url=endpoint_url)
+    previous_shards: dict[str, dict[str, str]] = remote_index.get('shards', {}) if remote_index else {}
+    reusable = previous_shards if remote_index and remote_index.get('algorithm') == manifest.algorithm else {}
+    shards: dict[str, dict[str, str]] = {}
+    uploaded = 0
+    os.makedirs(cache_dir, exist_ok=True)
     try:
-        client.upload_file(local_hash_file, bucket, key)
-        print('updated remote')
+        for shard, data in split_shards(manifest).items():
+            digest = md5(data).hexdigest()
+            if shard in reusable and reusable[shard]['digest'] == digest:
+                shards[shard] = reusable[shard]
+                continue
+            key = f'{prefix}{shard}-{digest}.bin'
+            response = client.put_object(Bucket=bucket, Key=key, Body=data, ContentType='application/octet-stream')
+            shards[shard] = {'key': key, 'digest': digest, 'etag': response['ETag'].strip('"')}
+            uploaded += 1
+            with open(os.path.join(cache_dir, f'{shard}.bin'), 'wb') as f:
+                f.write(data)
+        index = {
+            'version': 1,
+            'algorithm': manifest.algorithm,
+            'created_at': manifest.created_at,
+            'shards': shards,
+        }
+        client.put_object(
+            Bucket=bucket,
+            Key=f'{prefix}index.json',
+            Body=json.dumps(index, separators=(',', ':')).encode('utf-8'),
+            ContentType='application/json',
+        )
     except Exception as e:
         print(e)
+        return False
+    print(f'updated remote ({uploaded} of {len(shards)} hash shards changed)')
+    try:
+        for shard, shard_info in previous_shards.items():
+            if shards.get(shard, {}).get('key') != shard_info['key']:
+                client.delete_object(Bucket=bucket, Key=shard_info['key'])
+    except Exception as e:
+        print(e)
+    return True
+
+
+def _local_feed_runs(rootdir: str) -> set[str]:
+    index_file = os.path.join(rootdir, FEED_INDEX)
+    if not os.path.isfile(index_file):
+        return set()
+    with open(index_file, 'rb') as f:
+        return {run['run'] for run in load_feed_index(f.read())['runs']}
+
+
+def _limit_change_feed(rootdir: str, runs_before: set[str], is_published: Callable[[str], bool]) -> None:
+    """
+    Drop the changes whose object was not published from the runs added since ``runs_before``, so the feed
+    only lists what consumers can fetch. ``is_published`` is given the name objects are journaled under, the
+    call sign or pack name. Without a pack layout, the next run's feed is diffed against the published
+    hashes, which do not have the dropped changes either, so it lists them again.
+    """
+    index_file = os.path.join(rootdir, FEED_INDEX)
+    if not os.path.isfile(index_file):
+        return
+    with open(index_file, 'rb') as f:
+        index = load_feed_index(f.read())
+    for run in index['runs']:
+        if run['run'] in runs_before:
+            continue
+        with open(os.path.join(rootdir, run['key']), 'rb') as f:
+            feed = f.read()
+        header, limited = filter_change_feed(
+            feed, lambda entry: entry['key'] is None or is_published(pathlib.PurePosixPath(entry['key']).stem)
+        )
+        if limited != feed:
+            print(f'change feed {run["key"]}: dropped changes to objects that were not published')
+            write_change_feed(rootdir, header, limited)
+
+
+def _publish_change_feed(bucket: str, rootdir: str, endpoint_url: str | None = None) -> None:
+    """
+    Upload the local change feed runs that the remote feed index does not list yet, then the index.
+    Runs go up after the data they describe, so a feed never lists an object before it is published.
+    """
+    import boto3
+
+    local_index_file = os.path.join(rootdir, FEED_INDEX)
+    if not os.path.isfile(local_index_file):
+        return
+    with open(local_index_file, 'rb') as f:
+        local_index = load_feed_index(f.read())
+    client = boto3.client('s3', endpoint_url=endpoint_url)
+    try:
+        try:
+            remote_data = client.get_object(Bucket=bucket, Key=FEED_INDEX)['Body'].read()
+        except client.exceptions.NoSuchKey:
+            remote_data = None
+        remote_index = load_feed_index(remote_data)
+        published = {run['run'] for run in remote_index['runs']}
+        uploaded = 0
+        for run in local_index['runs']:
+            if run['run'] in published:
+                continue
+            with open(os.path.join(rootdir, run['key']), 'rb') as f:
+                client.put_object(Bucket=bucket, Key=run['key'], Body=f.read(), ContentType=content_type(run['key']))
+            add_to_feed_index(remote_index, run)
+            uploaded += 1
+        if uploaded:
+            client.put_object(
+                Bucket=bucket,
+                Key=FEED_INDEX,
+                Body=json.dumps(remote_index, separators=(',', ':')).encode('utf-8'),
+                ContentType='application/json',
+            )
+    except Exception as e:
+        print(e)
+        return
+    print(f'published {uploaded} change feed runs')
 
 
-def _upload_error_logs(bucket: str, errors: list[tuple[str, str]]) -> None:
+def _upload_error_logs(bucket: str, errors: list[tuple[str, str]], endpoint_url: str | None = None) -> None:
     import boto3
 
-    s3 = boto3.resource('s3')
+    s3 = boto3.resource('s3', endpoint_url=endpoint_url)
     now = datetime.datetime.now().strftime('%Y-%m-%d-%H-%M')
     key = f'errors/{now}.errors.json'
     contents = json.dumps(errors).encode('utf-8')
@@ -185,29 +843,104 @@ def main() -> None:
     parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False)
     parser.add_argument('-q', '--quiet', action='count', dest='quiet', default=0)
     parser.add_argument('--upload-bucket', dest='bucket')
+    parser.add_argument('--endpoint-url', dest='endpoint_url', default=None)
+    parser.add_argument('--from-archives', action='store_true', dest='from_archives', default=False)
+    parser.add_argument('--snapshot', dest='snapshot_file', default=None)
+    parser.add_argument('--parse-workers', type=int, dest='parse_workers', default=None)
+    parser.add_argument('--serialize-workers', type=int, dest='serialize_workers', default=None)
+    parser.add_argument('--compact-records', action='store_true', dest='compact_records', default=False)
+    parser.add_argument('--lazy-records', action='store_true', dest='lazy_records', default=False)
+    parser.add_argument('--records-cache', dest='records_cache', default=None)
+    parser.add_argument('--expiration-index', dest='expiration_index', default=None)
+    parser.add_argument('--packs', choices=PACK_LAYOUTS, dest='pack_layout', default=None)
+    parser.add_argument('--digest', dest='digest', choices=sorted(DIGESTS), default=DEFAULT_DIGEST)
+    parser.add_argument('--compress', choices=COMPRESSIONS, dest='compression', default=None)
+    parser.add_argument('--change-feed', action='store_true', dest='change_feed', default=False)
+    parser.add_argument('--no-local-mirror', action='store_false', dest='write_local', default=True)
+    parser.add_argument('--uploader', choices=['threads', 'async'], dest='uploader', default='threads')
+    parser.add_argument(
+        '--upload-workers', type=int, dest='upload_workers', default=None, help='threads, or concurrent async uploads'
+    )
+    parser.add_argument('--min-upload-workers', type=int, dest='min_upload_workers', default=4)
+    parser.add_argument('--max-upload-workers', type=int, dest='max_upload_workers', default=128)
+    parser.add_argument('--fixed-upload-workers', action='store_false', dest='adaptive_upload', default=True)
     args = parser.parse_args()
     if os.environ.get('CI'):
         quiet = 1
     else:
         quiet = args.quiet
 
-    hashfile = os.path.join(args.rootdir, 'hashes.json')
+    hashfile = os.path.join(args.rootdir, 'hashes.bin')
+    algorithm = manifest_algorithm(args.digest, args.compression, _key_layout(args.flat, args.pack_layout))
+    if args.pack_layout is None:
+        published_hashfile = hashfile
+        journal_file = os.path.join(args.rootdir, 'upload-journal.log')
+        remote_hashes_cache = os.path.join(args.rootdir, 'remote-hashes')
+        remote_hashes_prefix = REMOTE_HASHES_PREFIX
+    else:
+        # the remote manifest, the journal and the published hashes are keyed by pack
+        published_hashfile = os.path.join(args.rootdir, 'pack-hashes.bin')
+        journal_file = os.path.join(args.rootdir, 'pack-upload-journal.log')
+        remote_hashes_cache = os.path.join(args.rootdir, 'remote-pack-hashes')
+        remote_hashes_prefix = REMOTE_PACK_HASHES_PREFIX
+    remote_hashes = None
+    remote_index = None
     if args.bucket and not args.dry_run:
         print('retrieving remote hashes...')
-        remote_hashes = _get_remote_hashes(args.bucket)
-        if remote_hashes:
-            print('done', len(remote_hashes), 'received')
-        else:
+        remote = _get_remote_hashes(
+            args.bucket, cache_dir=remote_hashes_cache, prefix=remote_hashes_prefix, endpoint_url=args.endpoint_url
+        )
+        if remote is None:
             print('could not retrieve remote hashes')
-    else:
-        remote_hashes = None
+        else:
+            remote_manifest, remote_index = remote
+            if remote_manifest.algorithm != algorithm:
+                print(f'remote hashes use {remote_manifest.algorithm}, not {algorithm}; everything will be uploaded')
+            else:
+                remote_hashes = remote_manifest.hashes
+                print('done', len(remote_hashes), 'received')
+    journal = None
+    if args.bucket and not args.dry_run:
+        if not os.path.exists(args.rootdir):
+            os.mkdir(args.rootdir)
+        journal = UploadJournal(journal_file, bucket=args.bucket, algorithm=algorithm)
+        if journal.entries:
+            # an interrupted run published these after the remote hashes were last written
+            print(f'resuming after {len(journal.entries)} journaled uploads')
+            remote_hashes = fold_journal(remote_hashes or {}, journal.entries)
     import logging
 
     logging.basicConfig(level=logging.WARN)
-    if args.bucket:
-        uploader = Uploader(rootdir=args.rootdir, bucket_name=args.bucket, _dry_run=args.dry_run)
+    uploader: Uploader | AsyncUploader | None
+    if args.bucket and args.uploader == 'async':
+        uploader = AsyncUploader(
+            rootdir=args.rootdir,
+            bucket_name=args.bucket,
+            concurrency=args.upload_workers or 256,
+            _dry_run=args.dry_run,
+            quiet=quiet,
+            journal=journal,
+            content_encoding=args.compression,
+            endpoint_url=args.endpoint_url,
+        )
+    elif args.bucket:
+        uploader = Uploader(
+            rootdir=args.rootdir,
+            bucket_name=args.bucket,
+            num_workers=args.upload_workers or 32,
+            _dry_run=args.dry_run,
+            quiet=quiet,
+            min_workers=args.min_upload_workers,
+            max_workers=args.max_upload_workers,
+            adaptive=args.adaptive_upload,
+            journal=journal,
+            content_encoding=args.compression,
+            endpoint_url=args.endpoint_url,
+        )
     else:
         uploader = None
+    feed_runs_before = _local_feed_runs(args.rootdir) if args.change_feed else set()
+    completed = False
     try:
         for key in build(
             rootdir=args.rootdir,
@@ -216,9 +949,24 @@ def main() -> None:
             hash_file=hashfile,
             quiet=quiet,
             remote_hashes=remote_hashes,
+            from_archives=args.from_archives,
+            snapshot_file=args.snapshot_file,
+            parse_workers=args.parse_workers,
+            serialize_workers=args.serialize_workers,
+            compact_records=args.compact_records,
+            lazy_records=args.lazy_records,
+            records_cache=args.records_cache,
+            expiration_index=args.expiration_index,
+            pack_layout=args.pack_layout,
+            digest=args.digest,
+            compression=args.compression,
+            change_feed=args.change_feed,
+            payloads=uploader is not None,
+            write_local=args.write_local,
         ):
             if uploader is not None:
                 uploader.queue_upload(key)
+        completed = True
     except Exception as e:
         print('fatal exception', e)
     print('Waiting for uploads to complete...')
@@ -227,10 +975,34 @@ def main() -> None:
         print(len(uploader.upload_errors), 'upload errors')
         if args.bucket and uploader.upload_errors:
             print('uploading error logs')
-            _upload_error_logs(args.bucket, uploader.upload_errors)
-    print('Updating remote hashes')
-    if args.bucket and not args.dry_run:
-        _update_hashes_to_remote(hashfile, args.bucket)
+            _upload_error_logs(args.bucket, uploader.upload_errors, endpoint_url=args.endpoint_url)
+    current_hashes: dict[str, str] | None = None
+    published_hashes: dict[str, str] = {}
+    if journal is not None:
+        print('Updating remote hashes')
+        # only what was confirmed uploaded; a build that did not complete keeps the call signs it never reached
+        current_hashes = HashManifest.load(published_hashfile).hashes if completed else None
+        published = HashManifest(algorithm, fold_journal(remote_hashes or {}, journal.entries, current_hashes))
+        published_hashes = published.hashes
+        if _update_hashes_to_remote(
+            published,
+            args.bucket,
+            cache_dir=remote_hashes_cache,
+            remote_index=remote_index,
+            prefix=remote_hashes_prefix,
+            endpoint_url=args.endpoint_url,
+        ):
+            journal.discard()
+        else:
+            journal.close()
+    if args.change_feed and args.bucket and not args.dry_run:
+
+        def is_published(name: str) -> bool:
+            return current_hashes is not None and published_hashes.get(name) == current_hashes.get(name)
+
+        _limit_change_feed(args.rootdir, feed_runs_before, is_published)
+        print('Publishing change feed')
+        _publish_change_feed(args.bucket, args.rootdir, endpoint_url=args.endpoint_url)
     print('Done')
 
 
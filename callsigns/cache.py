@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import os
+import pathlib
+import pickle
+from typing import Iterable
+from typing import Mapping
+
+from .fetcher import _get_data_dir_date
+from .parser import LicenseRecord
+
+CACHE_VERSION = 1
+
+
+def records_cache_key(sources: Iterable[pathlib.Path]) -> tuple[str, ...]:
+    """
+    Identifies a set of data sources by the creation dates in their ``counts`` files.
+    A new weekly or daily archive changes the key, which invalidates the cache.
+    """
+    return tuple(_get_data_dir_date(source).isoformat() for source in sources)
+
+
+def load_cached_records(cache_file: str | pathlib.Path, key: tuple[str, ...]) -> dict[str, LicenseRecord] | None:
+    """
+    Returns the license records saved by ``save_cached_records`` for the same key, or ``None`` on a miss.
+    """
+    if not os.path.isfile(cache_file):
+        return None
+    with open(cache_file, 'rb') as f:
+        # the header is pickled separately so a stale cache is rejected without loading the records
+        header = pickle.load(f)
+        if header != {'version': CACHE_VERSION, 'key': key}:
+            return None
+        rows: list[tuple[str | None, ...]] = pickle.load(f)
+    make = LicenseRecord._make
+    return {row[3]: make(row) for row in rows}  # type: ignore[misc]
+
+
+def save_cached_records(
+    cache_file: str | pathlib.Path, key: tuple[str, ...], license_records: Mapping[str, LicenseRecord]
+) -> None:
+    # plain tuples pickle much smaller and faster than the NamedTuple instances
+    rows = [tuple(record) for record in license_records.values()]
+    tmpfile = f'{cache_file}.tmp'
+    with open(tmpfile, 'wb') as f:
+        pickle.dump({'version': CACHE_VERSION, 'key': key}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpfile, cache_file)
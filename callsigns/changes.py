@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import secrets
+import time
+from typing import Any
+from typing import Callable
+from typing import Mapping
+
+FEED_VERSION = 1
+CHANGES_DIR = 'changes'
+FEED_INDEX = f'{CHANGES_DIR}/index.json'
+
+# kinds of change, in the order call signs are listed within a run
+CHANGE_KINDS = ('new', 'changed', 'removed')
+
+
+def diff_hashes(previous: Mapping[str, str], current: Mapping[str, str]) -> list[tuple[str, str, str]]:
+    """
+    The ``(kind, call sign, digest)`` changes from one hash manifest to the next, sorted by call sign.
+    Removed call signs carry the digest they were last published with.
+    """
+    changes = []
+    for call_sign, digest in current.items():
+        previous_digest = previous.get(call_sign)
+        if previous_digest is None:
+            changes.append(('new', call_sign, digest))
+        elif previous_digest != digest:
+            changes.append(('changed', call_sign, digest))
+    changes.extend(('removed', call_sign, digest) for call_sign, digest in previous.items() if call_sign not in current)
+    changes.sort(key=lambda change: change[1])
+    return changes
+
+
+def run_id(created_at: float) -> str:
+    """
+    A unique, chronologically sortable run ID: the UTC time to the microsecond and a random suffix, so runs
+    started in the same second do not replace each other in the feed index.
+    """
+    seconds, microseconds = divmod(round(created_at * 1_000_000), 1_000_000)
+    timestamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime(seconds))
+    return f'{timestamp}.{microseconds:06d}Z-{secrets.token_hex(4)}'
+
+
+def feed_key(run: str) -> str:
+    return f'{CHANGES_DIR}/{run}.ndjson'
+
+
+def dumps_change_feed(
+    changes: list[tuple[str, str, str]],
+    key_of: Callable[[str], str | None],
+    created_at: float,
+    algorithm: str,
+    source_date: str | None = None,
+) -> tuple[dict[str, Any], bytes]:
+    """
+    Serialize the changes of one run as NDJSON: a header line, then one
+    ``{"change", "call_sign", "digest", "key"}`` line per call sign, where ``key`` is the object holding it.
+    Returns the header, which is also the run's entry in the feed index, and the serialized feed.
+    """
+    run = run_id(created_at)
+    counts = {kind: 0 for kind in CHANGE_KINDS}
+    lines = []
+    for kind, call_sign, digest in changes:
+        counts[kind] += 1
+        entry = {'change': kind, 'call_sign': call_sign, 'digest': digest, 'key': key_of(call_sign)}
+        lines.append(json.dumps(entry, separators=(',', ':')))
+    header = {
+        'version': FEED_VERSION,
+        'run': run,
+        'key': feed_key(run),
+        'created_at': created_at,
+        'source_date': source_date,
+        'algorithm': algorithm,
+        **counts,
+    }
+    lines.insert(0, json.dumps(header, separators=(',', ':')))
+    return header, ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def filter_change_feed(feed: bytes, keep: Callable[[Mapping[str, Any]], bool]) -> tuple[dict[str, Any], bytes]:
+    """
+    A run's serialized feed with only the changes ``keep`` accepts, and its header with the counts updated.
+    """
+    lines = feed.splitlines()
+    header: dict[str, Any] = json.loads(lines[0])
+    entries = [entry for entry in map(json.loads, lines[1:]) if keep(entry)]
+    header.update({kind: sum(entry['change'] == kind for entry in entries) for kind in CHANGE_KINDS})
+    kept = [json.dumps(header, separators=(',', ':'))]
+    kept.extend(json.dumps(entry, separators=(',', ':')) for entry in entries)
+    return header, ('\n'.join(kept) + '\n').encode('utf-8')
+
+
+def load_feed_index(data: bytes | None) -> dict[str, Any]:
+    if not data:
+        return {'version': FEED_VERSION, 'runs': []}
+    index: dict[str, Any] = json.loads(data)
+    if index.get('version') != FEED_VERSION:
+        raise ValueError(f'unsupported change feed version {index.get("version")!r}')
+    return index
+
+
+def add_to_feed_index(index: dict[str, Any], run: Mapping[str, Any]) -> None:
+    """
+    Append a run, replacing an earlier entry for the same run, and keep the runs in order.
+    """
+    runs = [entry for entry in index['runs'] if entry['run'] != run['run']]
+    runs.append(dict(run))
+    runs.sort(key=lambda entry: entry['run'])
+    index['runs'] = runs
+
+
+def write_change_feed(rootdir: str | pathlib.Path, header: Mapping[str, Any], feed: bytes) -> None:
+    """
+    Write a run's feed under ``rootdir / CHANGES_DIR`` and add it to the local feed index.
+    """
+    os.makedirs(os.path.join(rootdir, CHANGES_DIR), exist_ok=True)
+    with open(os.path.join(rootdir, header['key']), 'wb') as f:
+        f.write(feed)
+    index_file = os.path.join(rootdir, FEED_INDEX)
+    existing = None
+    if os.path.isfile(index_file):
+        with open(index_file, 'rb') as f:
+            existing = f.read()
+    index = load_feed_index(existing)
+    add_to_feed_index(index, header)
+    tmpfile = f'{index_file}.tmp'
+    with open(tmpfile, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(tmpfile, index_file)
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import gzip
+import posixpath
+
+# Content-Encoding values objects can be published with
+COMPRESSIONS = ('gzip', 'br')
+
+CONTENT_TYPES = {
+    '.json': 'application/json',
+    '.pack': 'application/octet-stream',
+    '.ndjson': 'application/x-ndjson',
+}
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """
+    Compress ``data`` for the given ``Content-Encoding``, as small as the format allows since objects are
+    compressed once and served many times. ``br`` requires the optional ``brotli`` package.
+    """
+    if encoding == 'gzip':
+        # no timestamp, so unchanged data compresses to the same bytes
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == 'br':
+        import brotli  # type: ignore[import-not-found]
+
+        return brotli.compress(data, quality=11)  # type: ignore[no-any-return]
+    raise ValueError(f'unknown compression {encoding!r}, expected one of {COMPRESSIONS}')
+
+
+def content_type(key: str) -> str:
+    return CONTENT_TYPES.get(posixpath.splitext(key)[1], 'application/octet-stream')
+
+
+def manifest_algorithm(digest: str, compression: str | None, layout: str | None = None) -> str:
+    """
+    The algorithm recorded in hash manifests: the digest of the uncompressed objects, tagged with the
+    layout of the object keys and the encoding they are published with, so changing either makes every
+    object stale. ``layout`` is ``None`` for the default flat layout.
+    """
+    tags = [tag for tag in (layout, compression) if tag is not None]
+    return '+'.join([digest, *tags])
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import array
+import bisect
+import datetime
+import os
+import pathlib
+import pickle
+from typing import Iterable
+from typing import Mapping
+from typing import Protocol
+from typing import Sequence
+
+EXPIRATIONS_VERSION = 1
+GRACE_PERIOD_YEARS = 2
+
+# license statuses under which the call sign is still held by the licensee
+HELD_STATUSES = frozenset({'Active', 'Term Pending', 'Pending Legal Status'})
+
+
+class _DatedRecord(Protocol):
+    @property
+    def status(self) -> str:
+        ...
+
+    @property
+    def expired_date(self) -> str | None:
+        ...
+
+    @property
+    def cancellation_date(self) -> str | None:
+        ...
+
+
+def parse_uls_date(value: str | None) -> int | None:
+    """
+    The proleptic Gregorian ordinal of a ULS ``MM/DD/YYYY`` date, or ``None`` if it is empty or malformed.
+    """
+    if not value:
+        return None
+    try:
+        month, day, year = value.split('/')
+        return datetime.date(int(year), int(month), int(day)).toordinal()
+    except ValueError:
+        return None
+
+
+def _add_years(ordinal: int, years: int) -> int:
+    date = datetime.date.fromordinal(ordinal)
+    try:
+        return date.replace(year=date.year + years).toordinal()
+    except ValueError:  # February 29th
+        return date.replace(year=date.year + years, day=28).toordinal()
+
+
+class DateIndex:
+    """
+    Call signs sorted by a date held as an ordinal, answering range queries by bisection.
+    """
+
+    def __init__(self, entries: Iterable[tuple[int, str]] = ()) -> None:
+        ordered = sorted(entries)
+        self.ordinals = array.array('l', [ordinal for ordinal, _call_sign in ordered])
+        self.call_signs = [call_sign for _ordinal, call_sign in ordered]
+
+    def __len__(self) -> int:
+        return len(self.ordinals)
+
+    def between(self, start: datetime.date, end: datetime.date) -> list[tuple[datetime.date, str]]:
+        """
+        The ``(date, call sign)`` entries dated from ``start`` through ``end``, in date order.
+        """
+        low = bisect.bisect_left(self.ordinals, start.toordinal())
+        high = bisect.bisect_right(self.ordinals, end.toordinal())
+        fromordinal = datetime.date.fromordinal
+        return [(fromordinal(self.ordinals[i]), self.call_signs[i]) for i in range(low, high)]
+
+
+class ExpirationIndex:
+    """
+    Expiration dates of the licenses currently held, and the end of the grace period of every call sign no
+    longer held, which is when it can be assigned again (``GRACE_PERIOD_YEARS`` after its latest license
+    expired or was canceled).
+    """
+
+    def __init__(self, expiring: DateIndex, grace_ends: DateIndex, version: int = EXPIRATIONS_VERSION) -> None:
+        self.version = version
+        self.expiring = expiring
+        self.grace_ends = grace_ends
+
+    @classmethod
+    def from_call_sign_records(cls, call_sign_records: Mapping[str, Sequence[_DatedRecord]]) -> ExpirationIndex:
+        """
+        Build the index from the output of ``records_by_call_sign`` (or ``LicenseRecordStore.by_call_sign``).
+        """
+        expiring: list[tuple[int, str]] = []
+        grace_ends: list[tuple[int, str]] = []
+        for call_sign, records in call_sign_records.items():
+            held = False
+            released: int | None = None
+            for record in records:
+                expired = parse_uls_date(record.expired_date)
+                if record.status in HELD_STATUSES:
+                    held = True
+                    if record.status == 'Active' and expired is not None:
+                        expiring.append((expired, call_sign))
+                    continue
+                release = parse_uls_date(record.cancellation_date) if record.status != 'Expired' else None
+                if release is None:
+                    release = expired
+                if release is not None and (released is None or release > released):
+                    released = release
+            if not held and released is not None:
+                grace_ends.append((_add_years(released, GRACE_PERIOD_YEARS), call_sign))
+        return cls(DateIndex(expiring), DateIndex(grace_ends))
+
+    def expiring_within(self, days: int, today: datetime.date | None = None) -> list[tuple[datetime.date, str]]:
+        """
+        Active licenses expiring from ``today`` through ``days`` days later.
+        """
+        if today is None:
+            today = datetime.date.today()
+        return self.expiring.between(today, today + datetime.timedelta(days=days))
+
+    def grace_period_ending(self, start: datetime.date, end: datetime.date) -> list[tuple[datetime.date, str]]:
+        """
+        Call signs whose grace period ends from ``start`` through ``end``.
+        """
+        return self.grace_ends.between(start, end)
+
+    def save(self, filename: str | pathlib.Path) -> None:
+        tmpfile = f'{filename}.tmp'
+        with open(tmpfile, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpfile, filename)
+
+    @classmethod
+    def load(cls, filename: str | pathlib.Path) -> ExpirationIndex | None:
+        """
+        Load an index written by ``save``. Returns ``None`` if it is missing or from another version.
+        """
+        if not os.path.isfile(filename):
+            return None
+        with open(filename, 'rb') as f:
+            index = pickle.load(f)
+        if not isinstance(index, cls) or index.version != EXPIRATIONS_VERSION:
+            return None
+        return index
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import csv
+import gzip
+import io
+import itertools
+import json
+import pathlib
+from typing import Any
+from typing import BinaryIO
+from typing import Iterable
+from typing import Iterator
+from typing import Mapping
+
+from .lazy import LazyLicenseRecord
+from .parser import LicenseRecord
+from .parser import precompute_synthetics
+
+EXPORT_CHUNK_SIZE = 50_000
+COLUMNS_VERSION = 1
+
+# ``columnar`` is Parquet when ``pyarrow`` is installed, else the ``columns`` fallback
+EXPORT_FORMATS = ('ndjson', 'csv', 'parquet', 'arrow', 'columns', 'columnar')
+_EXTENSION_FORMATS = {
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+}
+
+RECORD_FIELDS: tuple[str, ...] = LicenseRecord._fields
+SYNTHETIC_FIELDS = (
+    'call_sign_morse',
+    'morse_dits',
+    'morse_dahs',
+    'format',
+    'phonetic',
+    'syllable_length',
+    'fcc_uls_link',
+    'qrz_call_sign_link',
+)
+_INTEGER_FIELDS = frozenset({'morse_dits', 'morse_dahs', 'syllable_length'})
+
+ExportRecord = LicenseRecord | LazyLicenseRecord
+
+
+def export_fields(include_synthetic: bool = False) -> tuple[str, ...]:
+    return RECORD_FIELDS + SYNTHETIC_FIELDS if include_synthetic else RECORD_FIELDS
+
+
+def _has_pyarrow() -> bool:
+    try:
+        import pyarrow  # type: ignore[import-not-found]  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_format(filename: str | pathlib.Path, export_format: str | None = None) -> str:
+    """
+    The concrete format to write: ``export_format``, or the one of the file extension (ignoring ``.gz``).
+    """
+    if export_format is None:
+        path = pathlib.PurePath(filename)
+        suffix = pathlib.PurePath(path.stem).suffix if path.suffix == '.gz' else path.suffix
+        export_format = _EXTENSION_FORMATS.get(suffix, 'columnar')
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'unknown export format {export_format!r}, expected one of {EXPORT_FORMATS}')
+    if export_format == 'columnar':
+        return 'parquet' if _has_pyarrow() else 'columns'
+    return export_format
+
+
+def iter_chunks(
+    records: Mapping[str, ExportRecord] | Iterable[ExportRecord],
+    include_synthetic: bool = False,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> Iterator[list[dict[str, str | int | None]]]:
+    """
+    Yield the ``as_dict`` of ``records`` (e.g. the output of ``to_license_records``) ``chunk_size`` at a
+    time, so exports only hold one chunk of dicts in memory.
+    """
+    iterator = iter(records.values() if isinstance(records, Mapping) else records)
+    while chunk := list(itertools.islice(iterator, chunk_size)):
+        synthetics = precompute_synthetics(record.call_sign for record in chunk) if include_synthetic else None
+        yield [record.as_dict(include_synthetic=include_synthetic, synthetics=synthetics) for record in chunk]
+
+
+def _open_binary(filename: str | pathlib.Path) -> BinaryIO:
+    if str(filename).endswith('.gz'):
+        return gzip.open(filename, 'wb')  # type: ignore[return-value]
+    return open(filename, 'wb')
+
+
+def _write_ndjson(chunks: Iterable[list[dict[str, Any]]], f: BinaryIO) -> int:
+    count = 0
+    for chunk in chunks:
+        f.write(''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in chunk).encode('utf-8'))
+        count += len(chunk)
+    return count
+
+
+def _write_csv(chunks: Iterable[list[dict[str, Any]]], f: BinaryIO, fields: tuple[str, ...]) -> int:
+    text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+    writer = csv.DictWriter(text, fieldnames=fields)
+    writer.writeheader()
+    count = 0
+    for chunk in chunks:
+        writer.writerows(chunk)
+        count += len(chunk)
+    text.flush()
+    text.detach()
+    return count
+
+
+def _columns(chunk: list[dict[str, Any]], fields: tuple[str, ...]) -> dict[str, list[Any]]:
+    return {field: [row[field] for row in chunk] for field in fields}
+
+
+def _write_columns(chunks: Iterable[list[dict[str, Any]]], f: BinaryIO, fields: tuple[str, ...]) -> int:
+    # a header line with the schema, then one line per chunk mapping each field to its column of values
+    schema = [{'name': field, 'type': 'int' if field in _INTEGER_FIELDS else 'string'} for field in fields]
+    header = {'version': COLUMNS_VERSION, 'fields': schema}
+    f.write(json.dumps(header, separators=(',', ':')).encode('utf-8') + b'\n')
+    count = 0
+    for chunk in chunks:
+        group = {'rows': len(chunk), 'columns': _columns(chunk, fields)}
+        f.write(json.dumps(group, separators=(',', ':')).encode('utf-8') + b'\n')
+        count += len(chunk)
+    return count
+
+
+def _write_arrow(
+    chunks: Iterable[list[dict[str, Any]]], filename: str | pathlib.Path, fields: tuple[str, ...], export_format: str
+) -> int:
+    import pyarrow
+
+    schema = pyarrow.schema(
+        [(field, pyarrow.int32() if field in _INTEGER_FIELDS else pyarrow.string()) for field in fields]
+    )
+    if export_format == 'parquet':
+        import pyarrow.parquet  # type: ignore[import-not-found]
+
+        writer = pyarrow.parquet.ParquetWriter(str(filename), schema, compression='zstd')
+    else:
+        writer = pyarrow.ipc.new_file(str(filename), schema)
+    count = 0
+    try:
+        for chunk in chunks:
+            # each chunk becomes a row group (Parquet) or record batch (Arrow IPC)
+            writer.write_table(pyarrow.Table.from_pydict(_columns(chunk, fields), schema=schema))
+            count += len(chunk)
+    finally:
+        writer.close()
+    return count
+
+
+def export_records(
+    records: Mapping[str, ExportRecord] | Iterable[ExportRecord],
+    filename: str | pathlib.Path,
+    export_format: str | None = None,
+    include_synthetic: bool = False,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> int:
+    """
+    Write all ``records`` to a single file, streaming them ``chunk_size`` at a time. Returns the number of
+    records written.
+
+    ``export_format`` is one of ``EXPORT_FORMATS``, by default guessed from the extension of ``filename``.
+    ``parquet`` and ``arrow`` (Arrow IPC) require the optional ``pyarrow`` package; ``columns`` is the
+    dependency-free columnar fallback, NDJSON with a schema line and then one line of columns per chunk.
+    NDJSON, CSV and ``columns`` files are gzip-compressed when ``filename`` ends in ``.gz``.
+    """
+    export_format = resolve_format(filename, export_format)
+    fields = export_fields(include_synthetic)
+    chunks = iter_chunks(records, include_synthetic=include_synthetic, chunk_size=chunk_size)
+    if export_format in ('parquet', 'arrow'):
+        return _write_arrow(chunks, filename, fields, export_format)
+    with _open_binary(filename) as f:
+        if export_format == 'ndjson':
+            return _write_ndjson(chunks, f)
+        if export_format == 'csv':
+            return _write_csv(chunks, f, fields)
+        return _write_columns(chunks, f, fields)
+
+
+def main() -> None:
+    import argparse
+
+    from .parser import parse_all_raw
+    from .parser import to_license_records
+
+    parser = argparse.ArgumentParser(description='export all license records to one NDJSON, CSV or columnar file')
+    parser.add_argument('filename')
+    parser.add_argument('--format', dest='export_format', choices=EXPORT_FORMATS, default=None)
+    parser.add_argument('--synthetic', action='store_true', dest='include_synthetic', default=False)
+    parser.add_argument('--data-root', dest='data_root', default='callsign_data')
+    parser.add_argument('--from-archives', action='store_true', dest='from_archives', default=False)
+    parser.add_argument('--parse-workers', type=int, dest='parse_workers', default=None)
+    parser.add_argument('--chunk-size', type=int, dest='chunk_size', default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+    raw_records = parse_all_raw(
+        args.data_root, project=True, from_archives=args.from_archives, workers=args.parse_workers
+    )
+    count = export_records(
+        to_license_records(raw_records),
+        args.filename,
+        export_format=args.export_format,
+        include_synthetic=args.include_synthetic,
+        chunk_size=args.chunk_size,
+    )
+    print(f'exported {count} records to {args.filename}')
+
+
+if __name__ == '__main__':
+    main()
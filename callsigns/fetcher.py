@@ -1,22 +1,32 @@
 from __future__ import annotations
 
-import csv
+import concurrent.futures
 import datetime
+import email.utils
+import hashlib
+import json
 import os
 import pathlib
 import sys
-import urllib.request
 import zipfile
+from typing import Any
 
 import dateutil.parser
 import requests
 from dateutil import tz
+from requests.adapters import HTTPAdapter
 
 _days = ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']
 DAILY_URL_PATTERN = 'https://data.fcc.gov/download/pub/uls/daily/l_am_{}.zip'
 DAILY_URLS = [DAILY_URL_PATTERN.format(day) for day in _days]
 WEEKLY_URL = 'https://data.fcc.gov/download/pub/uls/complete/l_amat.zip'
 EASTERN = tz.gettz('US/Eastern')
+FETCH_WORKERS = 8
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # at most this much is lost when a transfer is cut off
+DOWNLOAD_ATTEMPTS = 5
+# seconds to connect, and to wait for each read; a transfer that stalls longer is resumed
+REQUEST_TIMEOUT = (10.0, 60.0)
+FETCH_STATE_FILE = 'fetch-state.json'
 
 
 FCC_HS_FIELD_NAMES = [
@@ -33,13 +43,12 @@ def get_all_callsigns(*hs_files: str) -> set[str]:
     """
     Given a set of HS record files, returns a set of all unique callsigns contained in those files.
     """
-    callsigns = set()
+    from .history import scan_hs_call_signs
+
+    callsigns: set[str] = set()
     for hs_file in hs_files:
-        with open(hs_file, 'r') as f:
-            reader = csv.DictReader(f, fieldnames=FCC_HS_FIELD_NAMES, delimiter='|')
-            for row in reader:
-                cs = row['Call Sign']
-                callsigns.add(cs)
+        with open(hs_file, 'rb') as f:
+            callsigns.update(scan_hs_call_signs(f))
     return callsigns
 
 
@@ -52,7 +61,19 @@ def _parse_counts_date_header(head: str) -> datetime.datetime:
     return dt
 
 
+def _get_archive_date(zip_fp: pathlib.Path) -> datetime.datetime:
+    with zipfile.ZipFile(zip_fp) as zip:
+        with zip.open('counts') as f:
+            head = str(f.readline(), 'utf-8')
+    return _parse_counts_date_header(head)
+
+
 def _get_data_dir_date(data_dir: pathlib.Path) -> datetime.datetime:
+    """
+    Returns the creation date from the ``counts`` file of an extracted data directory or of a ``.zip`` archive.
+    """
+    if data_dir.suffix == '.zip':
+        return _get_archive_date(data_dir)
     counts_file = data_dir / 'counts'
     with open(counts_file) as f:
         head = f.readline()
@@ -68,36 +89,149 @@ def _zip_is_newer(zip_fp: pathlib.Path, data_dir: pathlib.Path) -> bool:
     if not os.path.exists(data_dir / 'counts'):
         return True
     existing_date = _get_data_dir_date(data_dir)
-    with zipfile.ZipFile(zip_fp) as zip:
-        with zip.open('counts') as f:
-            head = str(f.readline(), 'utf-8')
-    new_date = _parse_counts_date_header(head)
+    new_date = _get_archive_date(zip_fp)
     if new_date > existing_date:
         return True
     else:
         return False
 
 
-def _fetch_archive(archive_url: str, dest_dir: pathlib.Path, extract: bool = True) -> None:
+def make_session(max_connections: int = FETCH_WORKERS) -> requests.Session:
+    """
+    A ``requests.Session`` keeping up to ``max_connections`` connections per host alive for reuse.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _load_fetch_state(state_file: pathlib.Path) -> dict[str, Any]:
+    try:
+        with open(state_file) as f:
+            state: dict[str, Any] = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return state
+
+
+def _save_fetch_state(state_file: pathlib.Path, state: dict[str, Any]) -> None:
+    tmpfile = f'{state_file}.tmp'
+    with open(tmpfile, 'w') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmpfile, state_file)
+
+
+def _file_sha256(filename: pathlib.Path | str) -> str:
+    with open(filename, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def _download(
+    session: requests.Session,
+    url: str,
+    dest: pathlib.Path,
+    state_file: pathlib.Path,
+    conditional_headers: dict[str, str],
+) -> bool:
+    """
+    Download ``url`` to ``dest`` through ``dest.part``, resuming with a ``Range`` request when the transfer
+    is cut off, in this run or an earlier one. The validators of the partial download are kept in the fetch
+    state so it is only resumed while the remote file is unchanged (``If-Range``).
+
+    Returns ``False`` when the server answers ``304 Not Modified`` to ``conditional_headers``.
+    """
+    partial = pathlib.Path(f'{dest}.part')
+    state = _load_fetch_state(state_file)
+    for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+        # byte ranges and sizes refer to the file itself, not a compressed transfer of it
+        headers = {'Accept-Encoding': 'identity', **conditional_headers}
+        partial_validators: dict[str, str] = state.get('partial', {})
+        validator = partial_validators.get('etag') or partial_validators.get('last_modified')
+        offset = partial.stat().st_size if partial.exists() else 0
+        if validator and offset:
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = validator
+        try:
+            with session.get(url, stream=True, headers=headers, timeout=REQUEST_TIMEOUT) as r:
+                if r.status_code == 304:
+                    return False
+                if r.status_code == 416:
+                    # the partial file does not fit the remote one any more
+                    state.pop('partial', None)
+                    partial.unlink(missing_ok=True)
+                    continue
+                r.raise_for_status()
+                if r.status_code == 206:
+                    # e.g. 'bytes 1048576-120000000/120000001'
+                    content_range, _, total = r.headers['Content-Range'].rpartition('/')
+                    if int(content_range.split()[-1].split('-')[0]) != offset:
+                        state.pop('partial', None)
+                        partial.unlink()
+                        continue
+                    expected_size = int(total)
+                    mode = 'ab'
+                    print(f'Resuming {url} from {offset} bytes', file=sys.stderr)
+                else:
+                    expected_size = int(r.headers.get('Content-Length', -1))
+                    mode = 'wb'
+                    print('Downloading {}'.format(url), file=sys.stderr)
+                    state['partial'] = {'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified')}
+                    _save_fetch_state(state_file, state)
+                with open(partial, mode) as f:
+                    for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            print(f'Download of {url} interrupted ({e}), attempt {attempt}/{DOWNLOAD_ATTEMPTS}', file=sys.stderr)
+            continue
+        size = partial.stat().st_size
+        if expected_size != -1 and size < expected_size:
+            print(f'Download of {url} incomplete ({size}/{expected_size} bytes)', file=sys.stderr)
+            continue
+        partial_validators = state.pop('partial', {})
+        state.update(
+            url=url,
+            etag=partial_validators.get('etag'),
+            last_modified=partial_validators.get('last_modified'),
+            sha256=_file_sha256(partial),
+            size=size,
+        )
+        os.replace(partial, dest)
+        _save_fetch_state(state_file, state)
+        print('Done', file=sys.stderr)
+        return True
+    raise OSError(f'could not download {url} in {DOWNLOAD_ATTEMPTS} attempts')
+
+
+def _fetch_archive(
+    archive_url: str, dest_dir: pathlib.Path, extract: bool = True, session: requests.Session | None = None
+) -> None:
+    """
+    Download ``archive_url`` to ``dest_dir / 'archive.zip'`` unless the server reports that the local copy is
+    current, and extract it if it is newer than the extracted files.
+
+    The ETag, Last-Modified and SHA-256 of the local copy are kept in ``dest_dir / FETCH_STATE_FILE`` and
+    sent back as ``If-None-Match``/``If-Modified-Since``; a local copy that no longer matches its hash is
+    downloaded again unconditionally.
+    """
+    if session is None:
+        session = make_session(1)
     zip_fp = (dest_dir / 'archive.zip').absolute()
+    state_file = dest_dir / FETCH_STATE_FILE
+    state = _load_fetch_state(state_file)
+    conditional_headers: dict[str, str] = {}
     if os.path.exists(zip_fp):
-        r = requests.head(archive_url)
-        r.raise_for_status()
-        content_length = int(r.headers['Content-Length'])
-
-        if os.stat(zip_fp).st_size != content_length:
-            # XXX: technically, a different archive CAN have the same size, but I feel this is pretty unlikely.
-            # For now, it's probably not worth worrying about (I hope)
-            tmpfile = str(zip_fp) + '.tmp'
-            print('Downloading {}'.format(archive_url), file=sys.stderr)
-            urllib.request.urlretrieve(archive_url, tmpfile)
-            print('Done', file=sys.stderr)
-            os.remove(zip_fp)
-            os.rename(tmpfile, zip_fp)
-    else:
-        print('Downloading {}'.format(archive_url), file=sys.stderr)
-        urllib.request.urlretrieve(archive_url, zip_fp)
-        print('Done', file=sys.stderr)
+        if state.get('url') == archive_url and state.get('sha256'):
+            if state.get('size') == os.stat(zip_fp).st_size and state['sha256'] == _file_sha256(zip_fp):
+                if state.get('etag'):
+                    conditional_headers['If-None-Match'] = state['etag']
+                if state.get('last_modified'):
+                    conditional_headers['If-Modified-Since'] = state['last_modified']
+        else:
+            # downloaded before fetch states were kept, the file is as new as its modification time
+            conditional_headers['If-Modified-Since'] = email.utils.formatdate(os.stat(zip_fp).st_mtime, usegmt=True)
+    _download(session, archive_url, zip_fp, state_file, conditional_headers)
     if extract:
         if _zip_is_newer(zip_fp, dest_dir):
             print('Extracting {}'.format(zip_fp), file=sys.stderr)
@@ -105,19 +239,27 @@ def _fetch_archive(archive_url: str, dest_dir: pathlib.Path, extract: bool = Tru
                 zip.extractall(dest_dir)
 
 
-def _should_get_day(last_weekly_date: datetime.date, day: str) -> bool:
-    url = DAILY_URL_PATTERN.format(day)
-    r = requests.head(url)
+def _get_last_modified(url: str, session: requests.Session) -> datetime.datetime:
+    r = session.head(url, timeout=REQUEST_TIMEOUT)
     r.raise_for_status()
-    last_modified_header = r.headers['Last-Modified']
-    last_modified_date = dateutil.parser.parse(last_modified_header)
-    if last_modified_date.date() > last_weekly_date:
-        return True
-    else:
-        return False
+    return dateutil.parser.parse(r.headers['Last-Modified'])
+
+
+def fetch_and_extract_all(
+    data_dir: pathlib.Path | str = 'callsign_data',
+    exists_ok: bool = True,
+    extract: bool = True,
+    max_workers: int = FETCH_WORKERS,
+) -> list[str]:
+    """
+    Download the weekly archive and any newer daily archives into ``data_dir``.
 
+    Returns the directories that were fetched. With ``extract=False`` the archives are left as
+    ``archive.zip`` in each directory, to be read in place by ``parse_all_raw(from_archives=True)``.
 
-def fetch_and_extract_all(data_dir: pathlib.Path | str = 'callsign_data', exists_ok: bool = True) -> list[str]:
+    Up to ``max_workers`` requests run at once over one pooled session: the daily archives are checked while
+    the weekly one downloads, and each archive is extracted as soon as its own download finishes.
+    """
     if os.path.exists(data_dir) and not exists_ok:
         raise DataDirExists(data_dir)
     if not os.path.exists(data_dir):
@@ -127,25 +269,34 @@ def fetch_and_extract_all(data_dir: pathlib.Path | str = 'callsign_data', exists
 
     if not os.path.exists(weekly_bin_dir):
         os.mkdir(weekly_bin_dir)
-
-    _fetch_archive(WEEKLY_URL, weekly_bin_dir)
-
-    dt = _get_data_dir_date(weekly_bin_dir)
-    previous_week = dt - datetime.timedelta(days=7)
-    assert (
-        dt.weekday() == 6 and previous_week.weekday() == 6
-    ), f'{dt} day != {previous_week} day ({dt.day!r} != {previous_week.day!r}'
-    previous_sunday = previous_week.date()
-
-    process_dirs = [str(weekly_bin_dir.absolute())]
-
     for day in _days:
         day_dir = data_dir / day
         if not os.path.exists(day_dir):
             os.mkdir(day_dir)
-        if _should_get_day(previous_sunday, day):
-            _fetch_archive(DAILY_URL_PATTERN.format(day), day_dir)
-            process_dirs.append(str(day_dir.absolute()))
+
+    with make_session(max_workers) as session, concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        weekly = executor.submit(_fetch_archive, WEEKLY_URL, weekly_bin_dir, extract, session)
+        last_modified = {
+            day: executor.submit(_get_last_modified, DAILY_URL_PATTERN.format(day), session) for day in _days
+        }
+        weekly.result()
+
+        dt = _get_data_dir_date(weekly_bin_dir if extract else weekly_bin_dir / 'archive.zip')
+        previous_week = dt - datetime.timedelta(days=7)
+        assert (
+            dt.weekday() == 6 and previous_week.weekday() == 6
+        ), f'{dt} day != {previous_week} day ({dt.day!r} != {previous_week.day!r}'
+        previous_sunday = previous_week.date()
+
+        process_dirs = [str(weekly_bin_dir.absolute())]
+        daily: list[concurrent.futures.Future[None]] = []
+        for day in _days:
+            day_dir = data_dir / day
+            if last_modified[day].result().date() > previous_sunday:
+                daily.append(executor.submit(_fetch_archive, DAILY_URL_PATTERN.format(day), day_dir, extract, session))
+                process_dirs.append(str(day_dir.absolute()))
+        for future in daily:
+            future.result()
 
     return process_dirs
 
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import re
+import struct
+import time
+from typing import Callable
+
+MANIFEST_MAGIC = b'CSHM'
+MANIFEST_VERSION = 1
+DEFAULT_DIGEST = 'md5'
+
+_REGION_DIGIT = re.compile(r'[A-Z]+(\d)')
+
+
+def _xxh3_64(data: bytes) -> str:
+    import xxhash  # type: ignore[import-not-found]
+
+    return xxhash.xxh3_64_hexdigest(data)  # type: ignore[no-any-return]
+
+
+# name -> function returning the hex digest of a published object's bytes.
+# md5 is the default because it is also the S3 ETag of a single-part upload.
+DIGESTS: dict[str, Callable[[bytes], str]] = {
+    'md5': lambda data: hashlib.md5(data).hexdigest(),
+    'blake2b': lambda data: hashlib.blake2b(data, digest_size=16).hexdigest(),
+    'blake2b-8': lambda data: hashlib.blake2b(data, digest_size=8).hexdigest(),
+    'xxh3-64': _xxh3_64,  # requires the optional ``xxhash`` package
+}
+
+
+def get_digest(name: str) -> Callable[[bytes], str]:
+    """
+    Returns the function computing hex digests with the named algorithm from ``DIGESTS``.
+    """
+    try:
+        return DIGESTS[name]
+    except KeyError:
+        raise ValueError(f'unknown digest {name!r}, expected one of {sorted(DIGESTS)}') from None
+
+
+class HashManifest:
+    """
+    The digests of the published objects of a build, keyed by call sign.
+
+    Saved as a gzip-compressed binary file: a JSON header line followed by one
+    ``<length byte><call sign><raw digest>`` entry per call sign.
+    """
+
+    def __init__(self, algorithm: str = DEFAULT_DIGEST, hashes: dict[str, str] | None = None) -> None:
+        self.algorithm = algorithm
+        self.hashes: dict[str, str] = hashes if hashes is not None else {}
+        self.created_at = time.time()
+
+    def dumps(self) -> bytes:
+        digest_size = len(bytes.fromhex(next(iter(self.hashes.values())))) if self.hashes else 0
+        header = {
+            'version': MANIFEST_VERSION,
+            'algorithm': self.algorithm,
+            'digest_size': digest_size,
+            'created_at': self.created_at,
+            'count': len(self.hashes),
+        }
+        parts = [MANIFEST_MAGIC, json.dumps(header, separators=(',', ':')).encode('utf-8'), b'\n']
+        for call_sign, hexdigest in self.hashes.items():
+            encoded = call_sign.encode('ascii')
+            parts.append(struct.pack('B', len(encoded)))
+            parts.append(encoded)
+            parts.append(bytes.fromhex(hexdigest))
+        return gzip.compress(b''.join(parts), compresslevel=6, mtime=0)
+
+    @classmethod
+    def loads(cls, data: bytes) -> HashManifest:
+        if data[:2] == b'\x1f\x8b':
+            data = gzip.decompress(data)
+        if not data.startswith(MANIFEST_MAGIC):
+            return cls._load_legacy(data)
+        header_start, header_end = len(MANIFEST_MAGIC), data.index(b'\n')
+        header = json.loads(data[header_start:header_end])
+        if header['version'] != MANIFEST_VERSION:
+            raise ValueError(f'unsupported hash manifest version {header["version"]!r}')
+        digest_size: int = header['digest_size']
+        hashes: dict[str, str] = {}
+        position = header_end + 1
+        for _ in range(header['count']):
+            start = position + 1
+            end = start + data[position]
+            call_sign = data[start:end].decode('ascii')
+            position = end + digest_size
+            hashes[call_sign] = data[end:position].hex()
+        manifest = cls(algorithm=header['algorithm'], hashes=hashes)
+        manifest.created_at = header['created_at']
+        return manifest
+
+    @classmethod
+    def _load_legacy(cls, data: bytes) -> HashManifest:
+        # ``{"created_at": ..., "hashes": {"<rootdir>/callsigns/[<region>/<prefix>/]<call sign>.json": md5}}``
+        legacy = json.loads(data)
+        hashes = {pathlib.PurePosixPath(path).stem: digest for path, digest in legacy['hashes'].items()}
+        manifest = cls(algorithm='md5', hashes=hashes)
+        manifest.created_at = legacy['created_at']
+        return manifest
+
+    @classmethod
+    def load(cls, filename: str | pathlib.Path) -> HashManifest:
+        with open(filename, 'rb') as f:
+            return cls.loads(f.read())
+
+    def save(self, filename: str | pathlib.Path) -> None:
+        tmpfile = f'{filename}.tmp'
+        with open(tmpfile, 'wb') as f:
+            f.write(self.dumps())
+        os.replace(tmpfile, filename)
+
+
+def shard_of(call_sign: str) -> str:
+    """
+    The shard of a call sign in a sharded manifest: its region digit, or ``other``.
+    """
+    match = _REGION_DIGIT.match(call_sign)
+    return match.group(1) if match else 'other'
+
+
+def split_shards(manifest: HashManifest) -> dict[str, bytes]:
+    """
+    Split a manifest into serialized per-shard manifests.
+
+    Shards are written sorted and without a creation time, so a shard whose digests did not change
+    serializes to the same bytes as before and does not need to be uploaded again.
+    """
+    shard_hashes: dict[str, dict[str, str]] = {}
+    for call_sign, hexdigest in manifest.hashes.items():
+        shard_hashes.setdefault(shard_of(call_sign), {})[call_sign] = hexdigest
+    shards: dict[str, bytes] = {}
+    for shard, hashes in sorted(shard_hashes.items()):
+        shard_manifest = HashManifest(algorithm=manifest.algorithm, hashes=dict(sorted(hashes.items())))
+        shard_manifest.created_at = 0.0
+        shards[shard] = shard_manifest.dumps()
+    return shards
@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import datetime
+import pathlib
+import sqlite3
+from types import TracebackType
+from typing import Iterable
+from typing import Iterator
+from typing import NamedTuple
+
+from .fetcher import _get_data_dir_date
+from .lazy import _ENCODING
+from .lazy import _iter_source_lines
+from .parser import get_included_sources
+
+HISTORY_VERSION = 1
+
+# HS history codes for a license being granted to or given up by its holder
+HELD_CODES = ('LIISS', 'LIREN')
+RELEASED_CODES = ('LIEXP', 'LICAN')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS sources (created TEXT PRIMARY KEY, events INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS events (
+    call_sign TEXT NOT NULL,
+    log_date TEXT NOT NULL,
+    usi TEXT NOT NULL,
+    code TEXT NOT NULL,
+    PRIMARY KEY (call_sign, log_date, usi, code)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_by_usi ON events (usi, log_date);
+'''
+
+
+class HistoryEvent(NamedTuple):
+    call_sign: str
+    log_date: datetime.date
+    usi: str
+    code: str
+
+
+def scan_hs_lines(lines: Iterable[bytes]) -> Iterator[tuple[str, str, str, str]]:
+    """
+    Project ``(call sign, ISO log date, USI, code)`` out of raw HS record lines.
+
+    Lines are split as bytes and only the four columns are decoded; the ``MM/DD/YYYY`` log date is
+    rewritten as an ISO date so that the strings sort chronologically. Rows whose log date is blank or is
+    not a valid date are skipped.
+    """
+    for line in lines:
+        fields = line.rstrip(b'\r\n').split(b'|')
+        if len(fields) < 6:
+            continue  # blank or short row
+        _record_type, usi, _file_number, call_sign, log_date, code = fields[:6]
+        month, _, rest = log_date.partition(b'/')
+        day, _, year = rest.partition(b'/')
+        try:
+            date = datetime.date(int(year), int(month), int(day))
+        except ValueError:
+            continue  # blank or malformed log date
+        yield (
+            str(call_sign, _ENCODING),
+            date.isoformat(),
+            str(usi, _ENCODING),
+            str(code, _ENCODING),
+        )
+
+
+def scan_hs_call_signs(lines: Iterable[bytes]) -> Iterator[str]:
+    """
+    Project only the call sign out of raw HS record lines, from every row that has one, whatever its log date.
+    """
+    for line in lines:
+        fields = line.rstrip(b'\r\n').split(b'|', 4)
+        if len(fields) < 4:
+            continue  # blank row, or too short to hold a call sign
+        yield str(fields[3], _ENCODING)
+
+
+def scan_hs_source(source: pathlib.Path) -> Iterator[tuple[str, str, str, str]]:
+    """
+    ``scan_hs_lines`` over the ``HS.dat`` of an extracted data directory or ``archive.zip``.
+    """
+    return scan_hs_lines(_iter_source_lines(source, 'HS.dat'))
+
+
+def _to_event(row: tuple[str, str, str, str]) -> HistoryEvent:
+    call_sign, log_date, usi, code = row
+    return HistoryEvent(call_sign, datetime.date.fromisoformat(log_date), usi, code)
+
+
+class HistoryIndex:
+    """
+    A SQLite index of HS history events by call sign and by USI.
+
+    Every data source is applied once, identified by the creation date in its ``counts`` file, so the index
+    can be brought up to date with each day's HS file instead of rescanning the full history.
+    """
+
+    def __init__(self, filename: str | pathlib.Path) -> None:
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.executescript(_SCHEMA)
+            row = self.connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None:
+                self.connection.execute("INSERT INTO meta VALUES ('version', ?)", (str(HISTORY_VERSION),))
+            elif int(row[0]) != HISTORY_VERSION:
+                raise ValueError(f'unsupported history index version {row[0]!r}')
+
+    def __enter__(self) -> HistoryIndex:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def add_source(self, source: pathlib.Path) -> int | None:
+        """
+        Add the HS events of a data source. Returns the number of new events, or ``None`` if the source
+        was already applied. The source is applied in a single transaction.
+        """
+        created = _get_data_dir_date(source).isoformat()
+        with self.connection:
+            if self.connection.execute('SELECT 1 FROM sources WHERE created = ?', (created,)).fetchone():
+                return None
+            before = self.connection.total_changes
+            self.connection.executemany('INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?)', scan_hs_source(source))
+            added = self.connection.total_changes - before
+            self.connection.execute('INSERT INTO sources VALUES (?, ?)', (created, added))
+        return added
+
+    def update(self, data_root: str = 'callsign_data', from_archives: bool = False) -> int:
+        """
+        Apply every included data source not applied yet. Returns the number of new events.
+        """
+        added = 0
+        for source in get_included_sources(data_root, from_archives=from_archives):
+            added += self.add_source(source) or 0
+        return added
+
+    def call_sign_history(self, call_sign: str) -> list[HistoryEvent]:
+        rows = self.connection.execute(
+            'SELECT call_sign, log_date, usi, code FROM events WHERE call_sign = ? ORDER BY log_date', (call_sign,)
+        )
+        return [_to_event(row) for row in rows]
+
+    def usi_history(self, usi: str) -> list[HistoryEvent]:
+        rows = self.connection.execute(
+            'SELECT call_sign, log_date, usi, code FROM events WHERE usi = ? ORDER BY log_date', (usi,)
+        )
+        return [_to_event(row) for row in rows]
+
+    def last_event(self, call_sign: str, codes: Iterable[str]) -> HistoryEvent | None:
+        codes = tuple(codes)
+        row = self.connection.execute(
+            'SELECT call_sign, log_date, usi, code FROM events '
+            f'WHERE call_sign = ? AND code IN ({", ".join("?" * len(codes))}) ORDER BY log_date DESC LIMIT 1',
+            (call_sign, *codes),
+        ).fetchone()
+        return _to_event(row) if row is not None else None
+
+    def last_held(self, call_sign: str) -> HistoryEvent | None:
+        """
+        The most recent grant or renewal of ``call_sign``.
+        """
+        return self.last_event(call_sign, HELD_CODES)
+
+    def last_released(self, call_sign: str) -> HistoryEvent | None:
+        """
+        The most recent expiration or cancellation of ``call_sign``.
+        """
+        return self.last_event(call_sign, RELEASED_CODES)
+
+
+def update_history(
+    history_file: str | pathlib.Path, data_root: str = 'callsign_data', from_archives: bool = False
+) -> int:
+    with HistoryIndex(history_file) as index:
+        return index.update(data_root, from_archives=from_archives)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import threading
+from typing import Mapping
+
+JOURNAL_VERSION = 1
+
+
+class UploadJournal:
+    """
+    Append-only log of the objects confirmed uploaded to a bucket, as ``<call sign> <digest>`` lines after a
+    JSON header. Every entry is flushed as it is recorded, so after a crash the journal still lists what was
+    published and a rerun can skip it. Once the remote hash manifest includes the entries, the journal is
+    discarded.
+    """
+
+    def __init__(self, filename: str | pathlib.Path, bucket: str, algorithm: str) -> None:
+        self.filename = filename
+        self.bucket = bucket
+        self.algorithm = algorithm
+        self.entries: dict[str, str] = {}
+        self._lock = threading.Lock()
+        if os.path.isfile(filename):
+            self._load()
+        resume = bool(self.entries)
+        self._file = open(filename, 'a' if resume else 'w', encoding='ascii')
+        if not resume:
+            header = {'version': JOURNAL_VERSION, 'bucket': bucket, 'algorithm': algorithm}
+            self._file.write(json.dumps(header, separators=(',', ':')) + '\n')
+            self._file.flush()
+
+    def _load(self) -> None:
+        with open(self.filename, encoding='ascii') as f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                return
+            if header != {'version': JOURNAL_VERSION, 'bucket': self.bucket, 'algorithm': self.algorithm}:
+                return  # left by a run against another bucket or with another digest, start over
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # torn write from the crash
+                call_sign, _, digest = line.rstrip('\n').partition(' ')
+                self.entries[call_sign] = digest
+
+    def record(self, call_sign: str, digest: str) -> None:
+        with self._lock:
+            self._file.write(f'{call_sign} {digest}\n')
+            self._file.flush()
+            self.entries[call_sign] = digest
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+    def discard(self) -> None:
+        """
+        Remove the journal once its entries are part of the remote hash manifest.
+        """
+        self.close()
+        os.remove(self.filename)
+
+
+def fold_journal(
+    remote_hashes: Mapping[str, str], journal: Mapping[str, str], current_hashes: Mapping[str, str] | None = None
+) -> dict[str, str]:
+    """
+    The digests actually published: the remote manifest updated with the journaled uploads.
+
+    With the ``current_hashes`` of a completed build, call signs it no longer has are dropped, and ones that
+    failed to upload keep their previous remote digest so the next run retries them.
+    """
+    if current_hashes is None:
+        return {**remote_hashes, **journal}
+    published: dict[str, str] = {}
+    for call_sign in current_hashes:
+        digest = journal.get(call_sign, remote_hashes.get(call_sign))
+        if digest is not None:
+            published[call_sign] = digest
+    return published
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import locale
+import pathlib
+import zipfile
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import Mapping
+from typing import Sequence
+
+from .constants import LICENSE_STATUS_CODES
+from .constants import OPERATOR_CLASS_CODES
+from .parser import _is_archive
+from .parser import CallSignSynthetics
+from .parser import get_included_sources
+from .parser import LicenseRecord
+from .parser import RECORD_FIELD_NAMES
+from .parser import RECORD_TYPES
+
+# the text encoding ``open(filename)`` uses for the record files in ``parse_file``
+_ENCODING = locale.getpreferredencoding(False)
+
+RawLines = dict[str, dict[str, bytes]]
+
+# bump when a change to ``LicenseRecord.as_dict`` or the serialization in ``build`` makes the same lines
+# produce different output, so line fingerprints from before the change stop matching
+LINE_FINGERPRINT_VERSION = 1
+
+
+def _iter_source_lines(source: pathlib.Path, filename: str) -> Iterator[bytes]:
+    if not _is_archive(source):
+        record_file = source / filename
+        if not record_file.exists():
+            return  # sometimes, there are no records for a day (sundays, especially)
+        with open(record_file, 'rb') as f:
+            yield from f
+        return
+    with zipfile.ZipFile(source) as archive:
+        if filename not in archive.namelist():
+            return
+        with archive.open(filename) as member:
+            yield from member
+
+
+def merge_lines(raw_lines: RawLines, record_type: str, lines: Iterable[bytes]) -> None:
+    """
+    Merge undecoded record lines into ``raw_lines`` by USI; later lines replace earlier ones.
+    """
+    for line in lines:
+        line = line.rstrip(b'\r\n')
+        if not line:
+            continue
+        usi = str(line.split(b'|', 2)[1], _ENCODING)
+        if usi not in raw_lines:
+            raw_lines[usi] = {record_type: line}
+        else:
+            raw_lines[usi][record_type] = line
+
+
+def parse_source_lines(sources: list[pathlib.Path]) -> RawLines:
+    """
+    Like ``parse_sources``, but keeps each record as its raw, undecoded line.
+    """
+    raw_lines: RawLines = {}
+    for record_type in RECORD_TYPES:
+        for source in sources:
+            merge_lines(raw_lines, record_type, _iter_source_lines(source, f'{record_type}.dat'))
+    return raw_lines
+
+
+def parse_all_lines(data_root: str = 'callsign_data', from_archives: bool = False) -> RawLines:
+    return parse_source_lines(get_included_sources(data_root, from_archives=from_archives))
+
+
+class _LazyField:
+    """
+    Descriptor decoding one column of a raw record line on access.
+    """
+
+    def __init__(
+        self,
+        record_type: str,
+        column: str,
+        convert: Callable[[str], str] | None = None,
+        missing_record: str | None = None,
+    ) -> None:
+        self.record_type = record_type
+        self.index = RECORD_FIELD_NAMES[record_type].index(column)
+        self.convert = convert
+        self.missing_record = missing_record
+
+    def __get__(self, instance: LazyLicenseRecord | None, owner: type | None = None) -> Any:
+        if instance is None:
+            return self
+        line = instance._lines[self.record_type]
+        if line is None:
+            return self.missing_record
+        # split in C, and no further than the column; ``materialize`` decodes all columns with one split
+        columns = line.split(b'|', self.index + 1)
+        if self.index >= len(columns):
+            return None  # short row
+        value = str(columns[self.index], _ENCODING)
+        if self.convert is not None:
+            return self.convert(value)
+        return value
+
+
+def _operator_class(value: str) -> str:
+    return OPERATOR_CLASS_CODES.get(value, value)
+
+
+def _status(value: str) -> str:
+    return LICENSE_STATUS_CODES[value]
+
+
+class LazyLicenseRecord:
+    """
+    A license record that keeps references to its raw HD, AM and EN lines and decodes a field only when it
+    is accessed. Fields, synthetic properties and ``as_dict`` match ``LicenseRecord``.
+    """
+
+    __slots__ = ('system_identifier', '_lines')
+
+    call_sign = _LazyField('HD', 'Call Sign')
+    status = _LazyField('HD', 'License Status', convert=_status)
+    frn = _LazyField('EN', 'FCC Registration Number (FRN)')
+    first_name = _LazyField('EN', 'First Name')
+    middle_initial = _LazyField('EN', 'MI')
+    last_name = _LazyField('EN', 'Last Name')
+    street_address = _LazyField('EN', 'Street Address')
+    attn_line = _LazyField('EN', 'Attention Line')
+    city = _LazyField('EN', 'City')
+    state = _LazyField('EN', 'State')
+    zip_code = _LazyField('EN', 'Zip Code')
+    po_box = _LazyField('EN', 'PO Box')
+    grant_date = _LazyField('HD', 'Grant Date')
+    expired_date = _LazyField('HD', 'Expired Date')
+    cancellation_date = _LazyField('HD', 'Cancellation Date')
+    operator_class = _LazyField('AM', 'Operator Class', convert=_operator_class, missing_record='')
+    group_code = _LazyField('AM', 'Group Code', missing_record='')
+    trustee_call_sign = _LazyField('AM', 'Trustee Call Sign', missing_record='')
+    trustee_name = _LazyField('AM', 'Trustee Name', missing_record='')
+    previous_call_sign = _LazyField('AM', 'Previous Call Sign', missing_record='')
+    region_code = _LazyField('AM', 'Region Code', missing_record='')
+    vanity = _LazyField('AM', 'Vanity Call Sign Change', missing_record='')
+    systematic = _LazyField('AM', 'Systematic Call Sign Change', missing_record='')
+
+    # these only read the fields above, so they work unchanged on lazy records
+    call_sign_morse = LicenseRecord.call_sign_morse
+    morse_dits = LicenseRecord.morse_dits
+    morse_dahs = LicenseRecord.morse_dahs
+    format = LicenseRecord.format
+    phonetic = LicenseRecord.phonetic
+    syllable_length = LicenseRecord.syllable_length
+    get_syllable_length = LicenseRecord.get_syllable_length
+    fcc_uls_link = LicenseRecord.fcc_uls_link
+    qrz_call_sign_link = LicenseRecord.qrz_call_sign_link
+
+    def __init__(self, system_identifier: str, lines: dict[str, bytes]) -> None:
+        if 'HD' not in lines or 'EN' not in lines:
+            raise KeyError('HD' if 'HD' not in lines else 'EN')
+        self.system_identifier = system_identifier
+        self._lines: dict[str, bytes | None] = {record_type: lines.get(record_type) for record_type in RECORD_TYPES}
+
+    def as_dict(
+        self, include_synthetic: bool = False, synthetics: Mapping[str, CallSignSynthetics] | None = None
+    ) -> dict[str, str | int | None]:
+        return self.materialize().as_dict(include_synthetic=include_synthetic, synthetics=synthetics)
+
+    def raw_lines(self) -> bytes:
+        """
+        The undecoded HD, AM and EN lines of the record, the AM line empty when there is none.
+        """
+        return b'\n'.join(self._lines[record_type] or b'' for record_type in RECORD_TYPES)
+
+    def materialize(self) -> LicenseRecord:
+        """
+        Decode every field, splitting each line once rather than locating fields one at a time.
+        """
+        columns = {
+            record_type: str(line, _ENCODING).split('|') if line is not None else None
+            for record_type, line in self._lines.items()
+        }
+        values: list[str | None] = []
+        for field in _LAZY_FIELDS:
+            if field is None:
+                values.append(self.system_identifier)
+                continue
+            record_columns = columns[field.record_type]
+            if record_columns is None:
+                values.append(field.missing_record)
+            elif field.index >= len(record_columns):
+                values.append(None)  # short row
+            elif field.convert is not None:
+                values.append(field.convert(record_columns[field.index]))
+            else:
+                values.append(record_columns[field.index])
+        return LicenseRecord(*values)  # type: ignore[arg-type]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, LazyLicenseRecord):
+            return self._lines == other._lines and self.system_identifier == other.system_identifier
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(system_identifier={self.system_identifier!r}, call_sign={self.call_sign!r})'
+
+
+# the descriptor of each ``LicenseRecord`` field in order, ``None`` for the system identifier slot
+_LAZY_FIELDS: list[_LazyField | None] = [
+    LazyLicenseRecord.__dict__[name] if name != 'system_identifier' else None for name in LicenseRecord._fields
+]
+
+
+def line_fingerprints(
+    call_sign_records: Mapping[str, Sequence[LazyLicenseRecord]], compute_digest: Callable[[bytes], str]
+) -> dict[str, str]:
+    """
+    A digest of the raw lines of each call sign's records. Equal fingerprints mean equal records, so a
+    call sign whose fingerprint did not change since the last build does not need to be serialized again.
+    """
+    return {
+        call_sign: compute_digest(b'\n\n'.join(record.raw_lines() for record in records))
+        for call_sign, records in call_sign_records.items()
+    }
+
+
+def line_fingerprint_algorithm(algorithm: str) -> str:
+    return f'{algorithm}+lines{LINE_FINGERPRINT_VERSION}'
+
+
+def to_lazy_license_records(raw_lines: RawLines) -> dict[str, LazyLicenseRecord]:
+    """
+    Lazy counterpart of ``to_license_records``: nothing but the record lines are kept until fields are read.
+    """
+    return {usi: LazyLicenseRecord(usi, lines) for usi, lines in raw_lines.items()}
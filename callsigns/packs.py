@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import json
+import re
+import struct
+from typing import Any
+from typing import Iterable
+
+PACK_MAGIC = b'CSPK'
+PACK_VERSION = 1
+PACKS_DIR = 'packs'
+
+# how call signs are grouped into packs: by prefix and region (``K1``, ``AA4``), or by region only
+PACK_LAYOUTS = ('prefix', 'region')
+
+_CALL_SIGN_PARTS = re.compile(r'([A-Z]+)(\d)[A-Z]+')
+_HEADER = struct.Struct('>4sI')
+
+
+def pack_name(call_sign: str, layout: str = 'prefix') -> str:
+    """
+    The pack holding a call sign: its prefix and region digit, or only the digit, or ``other``.
+    """
+    match = _CALL_SIGN_PARTS.match(call_sign)
+    if match is None:
+        return 'other'
+    prefix, region = match.groups()
+    if layout == 'prefix':
+        return f'{prefix}{region}'
+    if layout == 'region':
+        return region
+    raise ValueError(f'unknown pack layout {layout!r}, expected one of {PACK_LAYOUTS}')
+
+
+def pack_key(name: str) -> str:
+    return f'{PACKS_DIR}/{name}.pack'
+
+
+def pack_records(entries: Iterable[tuple[str, bytes]]) -> bytes:
+    """
+    Pack the serialized records of call signs into one object.
+
+    The object is ``CSPK``, the big-endian 32-bit length of the index, the index and then the records
+    back to back. The index is a JSON object mapping each call sign to the offset and length of its
+    records, counted from the end of the index, so a client can read the first 8 bytes, then the index,
+    then the one byte range it needs. Entries should be given sorted, for packs to serialize the same
+    when their records have not changed.
+    """
+    offsets: dict[str, list[int]] = {}
+    bodies = []
+    offset = 0
+    for call_sign, body in entries:
+        offsets[call_sign] = [offset, len(body)]
+        bodies.append(body)
+        offset += len(body)
+    index = json.dumps({'version': PACK_VERSION, 'records': offsets}, separators=(',', ':')).encode('utf-8')
+    return b''.join([_HEADER.pack(PACK_MAGIC, len(index)), index, *bodies])
+
+
+def read_pack_index(data: bytes) -> tuple[dict[str, list[int]], int]:
+    """
+    The index of a pack and the offset its record offsets are counted from. ``data`` only needs to
+    extend to the end of the index.
+    """
+    magic, index_length = _HEADER.unpack_from(data)
+    if magic != PACK_MAGIC:
+        raise ValueError('not a call sign pack')
+    index_start = _HEADER.size
+    start = index_start + index_length
+    index = json.loads(data[index_start:start])
+    if index['version'] != PACK_VERSION:
+        raise ValueError(f'unsupported pack version {index["version"]!r}')
+    records: dict[str, list[int]] = index['records']
+    return records, start
+
+
+def read_pack_record(data: bytes, call_sign: str) -> list[dict[str, Any]] | None:
+    """
+    The records of ``call_sign`` in a pack, or ``None`` if it is not in it.
+    """
+    records, start = read_pack_index(data)
+    if call_sign not in records:
+        return None
+    offset, length = records[call_sign]
+    offset += start
+    end = offset + length
+    result: list[dict[str, Any]] = json.loads(data[offset:end])
+    return result
@@ -1,11 +1,22 @@
 from __future__ import annotations
 
+import collections
+import concurrent.futures
+import contextlib
 import csv
+import functools
+import io
+import locale
+import multiprocessing.context
+import operator
 import os
 import pathlib
 import re
 import typing
+import zipfile
 from typing import Any
+from typing import Iterable
+from typing import Iterator
 from typing import Self
 
 from .constants import FCC_AM_FIELD_NAMES
@@ -19,40 +30,318 @@ from .constants import SYLLABLE_LENGTHS
 from .fetcher import _get_data_dir_date
 
 
+RECORD_TYPES = ('HD', 'AM', 'EN')
+
+RECORD_FIELD_NAMES = {
+    'HD': FCC_HD_FIELD_NAMES,
+    'AM': FCC_AM_FIELD_NAMES,
+    'EN': FCC_EN_FIELD_NAMES,
+}
+
+# The only columns ``to_license_records`` reads from each record type.
+# The Unique System Identifier must come first; it is used to merge rows.
+PROJECTED_FIELD_NAMES: dict[str, tuple[str, ...]] = {
+    'HD': (
+        'Unique System Identifier',
+        'Call Sign',
+        'License Status',
+        'Grant Date',
+        'Expired Date',
+        'Cancellation Date',
+    ),
+    'AM': (
+        'Unique System Identifier',
+        'Operator Class',
+        'Group Code',
+        'Region Code',
+        'Trustee Call Sign',
+        'Systematic Call Sign Change',
+        'Vanity Call Sign Change',
+        'Previous Call Sign',
+        'Trustee Name',
+    ),
+    'EN': (
+        'Unique System Identifier',
+        'First Name',
+        'MI',
+        'Last Name',
+        'Street Address',
+        'City',
+        'State',
+        'Zip Code',
+        'PO Box',
+        'Attention Line',
+        'FCC Registration Number (FRN)',
+    ),
+}
+
+
+# approximate size of the byte ranges large extracted record files are split into for parallel parsing
+PARSE_CHUNK_SIZE = 32 * 1024 * 1024
+
+# how many call signs' synthetic fields ``call_sign_synthetics`` keeps memoized
+SYNTHETICS_CACHE_SIZE = 2**17
+
+_CALL_SIGN_FORMAT = re.compile(r'([A-Z]+)\d([A-Z]+)')
+# each character to its Morse code or phonetic word plus a separating space, for ``str.translate``
+_MORSE_TRANSLATION = str.maketrans({c: f'{code} ' for c, code in MORSE_TABLE.items()})
+_PHONETIC_TRANSLATION = str.maketrans({c: f'{word} ' for c, word in PHONETIC_WORDS.items()})
+
+
 def parse_file(filename: str | pathlib.Path, field_names: list[str]) -> list[dict[str, Any]]:
     with open(filename) as f:
-        reader = csv.DictReader(f, fieldnames=field_names, delimiter='|', quoting=csv.QUOTE_NONE)
-        rows = list(reader)
+        return parse_lines(f, field_names)
+
+
+def parse_lines(lines: Iterable[str], field_names: list[str]) -> list[dict[str, Any]]:
+    reader = csv.DictReader(lines, fieldnames=field_names, delimiter='|', quoting=csv.QUOTE_NONE)
+    rows = list(reader)
     return rows
 
 
-def parse_all_raw(data_root: str = 'callsign_data') -> dict[str, dict[str, dict[str, Any]]]:
+def _is_archive(source: pathlib.Path) -> bool:
+    return source.suffix == '.zip'
+
+
+@contextlib.contextmanager
+def open_source_file(source: pathlib.Path, filename: str) -> Iterator[typing.TextIO | None]:
+    """
+    Open ``filename`` (e.g. ``HD.dat``) in a data source for reading as text, or yield ``None`` if it is absent.
+
+    A source is either an extracted data directory or a ULS ``.zip`` archive, whose members are
+    decompressed as they are read.
+    """
+    if not _is_archive(source):
+        record_file = source / filename
+        if not os.path.exists(record_file):
+            yield None
+            return
+        with open(record_file) as f:
+            yield f
+        return
+    with zipfile.ZipFile(source) as archive:
+        if filename not in archive.namelist():
+            yield None
+            return
+        with archive.open(filename) as member:
+            with io.TextIOWrapper(member) as f:
+                yield f
+
+
+def project_lines(lines: Iterable[str], indices: list[int]) -> Iterator[tuple[str | None, ...]]:
+    """
+    Split pipe-delimited lines and yield only the columns at the given indices, as tuples.
+
+    Equivalent to reading the same columns out of ``parse_file`` rows: blank lines are skipped and
+    columns missing from short rows are ``None``.
+    """
+    getter = operator.itemgetter(*indices)
+    min_length = max(indices) + 1
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line:
+            continue
+        values = line.split('|')
+        if len(values) < min_length:
+            values.extend([None] * (min_length - len(values)))  # type: ignore[list-item]
+        yield getter(values)
+
+
+def _projected_indices(record_type: str) -> list[int]:
+    field_names = RECORD_FIELD_NAMES[record_type]
+    return [field_names.index(column) for column in PROJECTED_FIELD_NAMES[record_type]]
+
+
+def iter_projected_rows(
+    filename: str | pathlib.Path, field_names: list[str], columns: tuple[str, ...]
+) -> Iterator[tuple[str | None, ...]]:
+    """
+    Lazily yield the given columns of each row of a record file as tuples, without building a dict per row.
+    """
+    indices = [field_names.index(column) for column in columns]
+    with open(filename) as f:
+        yield from project_lines(f, indices)
+
+
+def get_included_sources(
+    data_root: str | pathlib.Path = 'callsign_data', from_archives: bool = False
+) -> list[pathlib.Path]:
+    """
+    Returns the weekly data source plus every daily source at least as new, ordered oldest to newest.
+
+    Sources are the extracted data directories, or the ``archive.zip`` in each of them with ``from_archives=True``.
+    """
     root = pathlib.Path(data_root)
     weekly = root / 'weekly'
-    included = [weekly]
+    dailies = [root / dirname for dirname in os.listdir(data_root) if 'weekly' not in dirname]
+    if from_archives:
+        weekly = weekly / 'archive.zip'
+        dailies = [path / 'archive.zip' for path in dailies]
     weekly_date = _get_data_dir_date(weekly)
-    for dirname in os.listdir(data_root):
-        if 'weekly' in dirname:
-            continue
-        path = root / dirname
+    included = [weekly]
+    for path in dailies:
         dir_date = _get_data_dir_date(path)
         if dir_date >= weekly_date:
             included.append(path)
     included.sort(key=lambda d: _get_data_dir_date(d))
+    return included
+
+
+def merge_projected_rows(
+    records_by_usi: dict[str, dict[str, dict[str, Any]]],
+    record_type: str,
+    rows: Iterable[tuple[str | None, ...]],
+) -> None:
+    """
+    Merge projected rows of one record type into ``records_by_usi``; later rows replace earlier ones.
+    """
+    columns = PROJECTED_FIELD_NAMES[record_type]
+    for row in rows:
+        usi: str = row[0]  # type: ignore[assignment]
+        record = dict(zip(columns, row))
+        if usi not in records_by_usi:
+            records_by_usi[usi] = {record_type: record}
+        else:
+            records_by_usi[usi][record_type] = record
+
 
-    records = {}
-    record_fields = (FCC_HD_FIELD_NAMES, FCC_AM_FIELD_NAMES, FCC_EN_FIELD_NAMES)
-    record_types = ('HD', 'AM', 'EN')
-    for record_type, field_names in zip(record_types, record_fields):
+def _line_aligned_ranges(filename: str | pathlib.Path, chunk_size: int) -> list[tuple[int, int]]:
+    """
+    Split a file into byte ranges of roughly ``chunk_size`` that each end on a line boundary.
+    """
+    size = os.path.getsize(filename)
+    boundaries = [0]
+    with open(filename, 'rb') as f:
+        offset = chunk_size
+        while offset < size:
+            f.seek(offset)
+            f.readline()
+            offset = f.tell()
+            if offset >= size:
+                break
+            boundaries.append(offset)
+            offset += chunk_size
+    boundaries.append(size)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def _parse_source_part(
+    source: pathlib.Path, record_type: str, byte_range: tuple[int, int] | None
+) -> list[tuple[str | None, ...]]:
+    if byte_range is None:
+        with open_source_file(source, f'{record_type}.dat') as f:
+            if f is None:
+                return []
+            return list(project_lines(f, _projected_indices(record_type)))
+    start, end = byte_range
+    with open(source / f'{record_type}.dat', 'rb') as binary_file:
+        binary_file.seek(start)
+        data = binary_file.read(end - start)
+    # decoded and newline-translated the same way as ``open(filename)`` would
+    lines = io.StringIO(data.decode(locale.getpreferredencoding(False)), newline=None)
+    return list(project_lines(lines, _projected_indices(record_type)))
+
+
+def process_pool_context() -> multiprocessing.context.BaseContext:
+    """
+    The start method for process pools: ``forkserver`` where available, else ``spawn``. Never ``fork``,
+    since the callers may already run other threads (uploads) that a forked child would inherit mid-operation.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def _parse_sources_parallel(
+    sources: list[pathlib.Path],
+    records_by_usi: dict[str, dict[str, dict[str, Any]]],
+    workers: int,
+    chunk_size: int,
+) -> None:
+    parts: list[tuple[pathlib.Path, str, tuple[int, int] | None]] = []
+    for record_type in RECORD_TYPES:
+        for source in sources:
+            record_file = source / f'{record_type}.dat'
+            if _is_archive(source) or not os.path.exists(record_file):
+                parts.append((source, record_type, None))
+                continue
+            parts.extend(
+                (source, record_type, byte_range) for byte_range in _line_aligned_ranges(record_file, chunk_size)
+            )
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=process_pool_context()) as executor:
+        # submitted and merged in the same (record type, source, offset) order as a sequential parse,
+        # so later records still replace earlier ones; at most ``workers * 2`` parsed parts wait to be merged
+        pending: collections.deque[
+            tuple[str, concurrent.futures.Future[list[tuple[str | None, ...]]]]
+        ] = collections.deque()
+        for source, record_type, byte_range in parts:
+            pending.append((record_type, executor.submit(_parse_source_part, source, record_type, byte_range)))
+            if len(pending) > workers * 2:
+                record_type, future = pending.popleft()
+                merge_projected_rows(records_by_usi, record_type, future.result())
+        while pending:
+            record_type, future = pending.popleft()
+            merge_projected_rows(records_by_usi, record_type, future.result())
+
+
+def parse_all_raw(
+    data_root: str = 'callsign_data', project: bool = False, from_archives: bool = False, workers: int | None = None
+) -> dict[str, dict[str, dict[str, Any]]]:
+    """
+    Parse and merge the HD, AM and EN records of the weekly and current daily data sources, by USI.
+
+    With ``project=True``, rows are streamed straight into the merge and only carry the
+    ``PROJECTED_FIELD_NAMES`` columns, which is all ``to_license_records`` needs.
+    With ``from_archives=True``, records are read directly out of each ``archive.zip`` instead of extracted files.
+    With ``workers`` greater than one, files are parsed in that many processes (see ``parse_sources``).
+    """
+    included = get_included_sources(data_root, from_archives=from_archives)
+    return parse_sources(included, project=project, workers=workers)
+
+
+def parse_sources(
+    sources: list[pathlib.Path],
+    project: bool = False,
+    records_by_usi: dict[str, dict[str, dict[str, Any]]] | None = None,
+    workers: int | None = None,
+    chunk_size: int = PARSE_CHUNK_SIZE,
+) -> dict[str, dict[str, dict[str, Any]]]:
+    """
+    Parse and merge the records of the given data sources, which must be ordered oldest to newest.
+
+    Records are merged into ``records_by_usi`` when it is given, replacing any older record of the same type.
+
+    With ``workers`` greater than one (``project=True`` only), every record file, or every ``chunk_size`` byte
+    range of a large extracted one, is parsed in a process pool and the results are merged in source order.
+    """
+    if records_by_usi is None:
+        records_by_usi = {}
+    if workers is not None and workers > 1:
+        if not project:
+            raise ValueError('parallel parsing is only supported with project=True')
+        _parse_sources_parallel(sources, records_by_usi, workers=workers, chunk_size=chunk_size)
+        return records_by_usi
+    if project:
+        for record_type in RECORD_TYPES:
+            for source in sources:
+                with open_source_file(source, f'{record_type}.dat') as f:
+                    if f is None:
+                        continue  # sometimes, there are no records for a day (sundays, especially)
+                    projected_rows = project_lines(f, _projected_indices(record_type))
+                    merge_projected_rows(records_by_usi, record_type, projected_rows)
+        return records_by_usi
+
+    records: dict[str, list[dict[str, Any]]] = {}
+    for record_type in RECORD_TYPES:
+        field_names = RECORD_FIELD_NAMES[record_type]
         record_rows = []
-        for path in included:
-            record_file = path / f'{record_type}.dat'
-            if not os.path.exists(record_file):
-                continue  # sometimes, there are no records for a day (sundays, especially)
-            rows = parse_file(record_file, field_names=field_names)
+        for source in sources:
+            with open_source_file(source, f'{record_type}.dat') as f:
+                if f is None:
+                    continue  # sometimes, there are no records for a day (sundays, especially)
+                rows = parse_lines(f, field_names=field_names)
             record_rows.extend(rows)
         records[record_type] = record_rows
-    records_by_usi: dict[str, dict[str, dict[str, Any]]] = {}
     for record_type, record_list in records.items():
         for record in record_list:
             usi: str = record['Unique System Identifier']
@@ -64,7 +353,13 @@ def parse_all_raw(data_root: str = 'callsign_data') -> dict[str, dict[str, dict[
 
 
 def to_license_records(raw_records: dict[str, dict[str, dict[str, Any]]]) -> dict[str, LicenseRecord]:
-    license_records: dict[str, LicenseRecord] = {}
+    return dict(iter_license_records(raw_records))
+
+
+def iter_license_records(raw_records: dict[str, dict[str, dict[str, Any]]]) -> Iterator[tuple[str, LicenseRecord]]:
+    """
+    Lazily convert merged raw records to ``(usi, LicenseRecord)`` pairs, in the order of ``raw_records``.
+    """
     for usi, record_data in raw_records.items():
         call_sign = record_data['HD']['Call Sign']
         status = LICENSE_STATUS_CODES[record_data['HD']['License Status']]
@@ -117,12 +412,20 @@ def to_license_records(raw_records: dict[str, dict[str, dict[str, Any]]]) -> dic
             vanity=vanity,
             systematic=systematic,
         )
-        license_records[usi] = license_record
-    return license_records
+        yield usi, license_record
+
+
+class _HasCallSign(typing.Protocol):
+    @property
+    def call_sign(self) -> str:
+        ...
 
 
-def records_by_call_sign(license_records: dict[str, LicenseRecord]) -> dict[str, list[LicenseRecord]]:
-    call_sign_records: dict[str, list[LicenseRecord]] = {}
+_RecordT = typing.TypeVar('_RecordT', bound=_HasCallSign)
+
+
+def records_by_call_sign(license_records: typing.Mapping[str, _RecordT]) -> dict[str, list[_RecordT]]:
+    call_sign_records: dict[str, list[_RecordT]] = {}
     for usi, license_record in license_records.items():
         call_sign = license_record.call_sign
         if call_sign not in call_sign_records:
@@ -132,6 +435,51 @@ def records_by_call_sign(license_records: dict[str, LicenseRecord]) -> dict[str,
     return call_sign_records
 
 
+class CallSignSynthetics(typing.NamedTuple):
+    """
+    The synthetic fields of ``LicenseRecord`` that only depend on the call sign.
+    """
+
+    call_sign_morse: str
+    morse_dits: int
+    morse_dahs: int
+    format: str
+    phonetic: str
+    syllable_length: int
+
+
+def _compute_synthetics(call_sign: str) -> CallSignSynthetics:
+    # summing the syllables also rejects characters the translation tables would pass through
+    syllable_length = sum(map(SYLLABLE_LENGTHS.__getitem__, call_sign))
+    call_sign_morse = call_sign.translate(_MORSE_TRANSLATION)[:-1]
+    match = _CALL_SIGN_FORMAT.match(call_sign)
+    return CallSignSynthetics(
+        call_sign_morse,
+        call_sign_morse.count('.'),
+        call_sign_morse.count('-'),
+        f'{len(match.group(1))}x{len(match.group(2))}' if match else '',
+        call_sign.translate(_PHONETIC_TRANSLATION)[:-1],
+        syllable_length,
+    )
+
+
+@functools.lru_cache(maxsize=SYNTHETICS_CACHE_SIZE)
+def call_sign_synthetics(call_sign: str) -> CallSignSynthetics:
+    """
+    The synthetic fields of ``call_sign``, memoized for the most recently used call signs.
+    """
+    return _compute_synthetics(call_sign)
+
+
+def precompute_synthetics(call_signs: Iterable[str]) -> dict[str, CallSignSynthetics]:
+    """
+    Compute the synthetic fields of every distinct call sign in one pass, for ``as_dict(synthetics=...)``.
+    Unlike the ``call_sign_synthetics`` cache, the result covers any number of call signs and lives as long
+    as the caller keeps it.
+    """
+    return {call_sign: _compute_synthetics(call_sign) for call_sign in set(call_signs)}
+
+
 class LicenseRecord(typing.NamedTuple):
     call_sign: str
     status: str
@@ -160,32 +508,27 @@ class LicenseRecord(typing.NamedTuple):
 
     @property
     def call_sign_morse(self) -> str:
-        return ' '.join(MORSE_TABLE[c] for c in self.call_sign)
+        return call_sign_synthetics(self.call_sign).call_sign_morse
 
     @property
     def morse_dits(self) -> int:
-        return self.call_sign_morse.count('.')
+        return call_sign_synthetics(self.call_sign).morse_dits
 
     @property
     def morse_dahs(self) -> int:
-        return self.call_sign_morse.count('-')
+        return call_sign_synthetics(self.call_sign).morse_dahs
 
     @property
     def format(self) -> str:
-        pattern = r'([A-Z]+)\d([A-Z]+)'
-        match = re.match(pattern, self.call_sign)
-        if not match:
-            return ''
-        prefix, suffix = match.groups()
-        return f'{len(prefix)}x{len(suffix)}'
+        return call_sign_synthetics(self.call_sign).format
 
     @property
     def phonetic(self) -> str:
-        return ' '.join(PHONETIC_WORDS[c] for c in self.call_sign)
+        return call_sign_synthetics(self.call_sign).phonetic
 
     @property
     def syllable_length(self) -> int:
-        return self.get_syllable_length()
+        return call_sign_synthetics(self.call_sign).syllable_length
 
     def get_syllable_length(self, lengths: dict[str, int] | None = None) -> int:
         if lengths is None:
@@ -200,7 +543,13 @@ class LicenseRecord(typing.NamedTuple):
     def qrz_call_sign_link(self) -> str:
         return f'https://www.qrz.com/db/{self.call_sign}'
 
-    def as_dict(self, include_synthetic: bool = False) -> dict[str, str | int | None]:
+    def as_dict(
+        self, include_synthetic: bool = False, synthetics: typing.Mapping[str, CallSignSynthetics] | None = None
+    ) -> dict[str, str | int | None]:
+        """
+        The record as a dict, with the synthetic fields too if ``include_synthetic`` is set. These are looked
+        up in ``synthetics`` (see ``precompute_synthetics``) when given, else in the shared memo.
+        """
         d: dict[str, str | int | None] = {
             'call_sign': self.call_sign,
             'status': self.status,
@@ -228,14 +577,17 @@ class LicenseRecord(typing.NamedTuple):
             'systematic': self.systematic,
         }
         if include_synthetic:
+            computed = synthetics.get(self.call_sign) if synthetics is not None else None
+            if computed is None:
+                computed = call_sign_synthetics(self.call_sign)
             d.update(
                 {
-                    'call_sign_morse': self.call_sign_morse,
-                    'morse_dits': self.morse_dits,
-                    'morse_dahs': self.morse_dahs,
-                    'format': self.format,
-                    'phonetic': self.phonetic,
-                    'syllable_length': self.syllable_length,
+                    'call_sign_morse': computed.call_sign_morse,
+                    'morse_dits': computed.morse_dits,
+                    'morse_dahs': computed.morse_dahs,
+                    'format': computed.format,
+                    'phonetic': computed.phonetic,
+                    'syllable_length': computed.syllable_length,
                     'fcc_uls_link': self.fcc_uls_link,
                     'qrz_call_sign_link': self.qrz_call_sign_link,
                 }
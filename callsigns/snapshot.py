@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import datetime
+import os
+import pathlib
+import pickle
+from typing import Any
+
+from .fetcher import _get_data_dir_date
+from .parser import get_included_sources
+from .parser import LicenseRecord
+from .parser import parse_sources
+from .parser import to_license_records
+
+SNAPSHOT_VERSION = 1
+
+
+class Snapshot:
+    """
+    The merged per-USI record state of a weekly dump plus the daily archives applied on top of it.
+    """
+
+    def __init__(
+        self,
+        weekly_date: datetime.datetime,
+        records_by_usi: dict[str, dict[str, dict[str, Any]]],
+        applied_through: datetime.datetime | None = None,
+        version: int = SNAPSHOT_VERSION,
+    ) -> None:
+        self.version = version
+        self.weekly_date = weekly_date
+        # creation date of the newest daily archive merged into the snapshot
+        self.applied_through = applied_through if applied_through is not None else weekly_date
+        self.records_by_usi = records_by_usi
+
+    def apply_source(self, source: pathlib.Path) -> set[str]:
+        """
+        Merge the records of a daily data source into the snapshot. Returns the call signs whose records changed.
+        """
+        delta = parse_sources([source], project=True)
+        changed: set[str] = set()
+        for usi, delta_data in delta.items():
+            old_data = self.records_by_usi.get(usi)
+            if old_data is None:
+                new_data = delta_data
+                self.records_by_usi[usi] = new_data
+            else:
+                new_data = old_data | delta_data
+                self.records_by_usi[usi] = new_data
+            old_record = _convert(usi, old_data)
+            new_record = _convert(usi, new_data)
+            if old_record == new_record:
+                continue
+            if old_record is not None:
+                changed.add(old_record.call_sign)
+            if new_record is not None:
+                changed.add(new_record.call_sign)
+        self.applied_through = _get_data_dir_date(source)
+        return changed
+
+
+def _convert(usi: str, record_data: dict[str, dict[str, Any]] | None) -> LicenseRecord | None:
+    if record_data is None:
+        return None
+    try:
+        return to_license_records({usi: record_data})[usi]
+    except KeyError:
+        # incomplete until a later file provides the rest of its records
+        return None
+
+
+def load_snapshot(snapshot_file: str | pathlib.Path) -> Snapshot | None:
+    """
+    Load a snapshot written by ``save_snapshot``. Returns ``None`` if it is missing or from another version.
+    """
+    if not os.path.isfile(snapshot_file):
+        return None
+    with open(snapshot_file, 'rb') as f:
+        data = pickle.load(f)
+    if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION:
+        return None
+    return Snapshot(
+        weekly_date=data['weekly_date'],
+        records_by_usi=data['records_by_usi'],
+        applied_through=data['applied_through'],
+    )
+
+
+def save_snapshot(snapshot: Snapshot, snapshot_file: str | pathlib.Path) -> None:
+    data = {
+        'version': snapshot.version,
+        'weekly_date': snapshot.weekly_date,
+        'applied_through': snapshot.applied_through,
+        'records_by_usi': snapshot.records_by_usi,
+    }
+    tmpfile = f'{snapshot_file}.tmp'
+    with open(tmpfile, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmpfile, snapshot_file)
+
+
+def update_snapshot(
+    snapshot_file: str | pathlib.Path,
+    data_root: str = 'callsign_data',
+    from_archives: bool = False,
+    workers: int | None = None,
+) -> tuple[Snapshot, set[str] | None]:
+    """
+    Bring the snapshot at ``snapshot_file`` up to date with the data sources under ``data_root``.
+
+    If the snapshot was taken from the current weekly dump, only daily sources newer than it are parsed
+    and applied, and the call signs they changed are returned. Otherwise the snapshot is rebuilt from
+    all sources and the changed call signs are ``None`` (unknown, treat everything as changed).
+    The updated snapshot is not saved; call ``save_snapshot`` once its changes have been processed.
+    """
+    weekly, *dailies = get_included_sources(data_root, from_archives=from_archives)
+    weekly_date = _get_data_dir_date(weekly)
+    snapshot = load_snapshot(snapshot_file)
+    if snapshot is None or snapshot.weekly_date != weekly_date:
+        snapshot = Snapshot(
+            weekly_date=weekly_date,
+            records_by_usi=parse_sources([weekly, *dailies], project=True, workers=workers),
+            applied_through=_get_data_dir_date(dailies[-1]) if dailies else None,
+        )
+        return snapshot, None
+    changed: set[str] = set()
+    for source in dailies:
+        if _get_data_dir_date(source) <= snapshot.applied_through:
+            continue
+        changed |= snapshot.apply_source(source)
+    return snapshot, changed
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import array
+from typing import Any
+from typing import Iterable
+from typing import Iterator
+from typing import Mapping
+
+from .parser import iter_license_records
+from .parser import LicenseRecord
+
+
+class StringTable:
+    """
+    Dictionary encoding for one column: each distinct value is stored once and rows refer to it by code.
+    """
+
+    def __init__(self) -> None:
+        self.values: list[str | None] = []
+        self._codes: dict[str | None, int] | None = {}
+
+    def encode(self, value: str | None) -> int:
+        if self._codes is None:
+            raise RuntimeError('table is frozen')
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def code_of(self, value: str | None) -> int | None:
+        if self._codes is None:
+            raise RuntimeError('table is frozen')
+        return self._codes.get(value)
+
+    def freeze(self, keep_index: bool = False) -> None:
+        """
+        Stop accepting new values. Unless ``keep_index`` is set, the value -> code lookup is dropped to save memory.
+        """
+        if not keep_index:
+            self._codes = None
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class LicenseRecordStore(Mapping[str, LicenseRecord]):
+    """
+    Columnar, dictionary-encoded collection of license records, keyed by Unique System Identifier.
+
+    Every field is stored as an array of codes into a ``StringTable`` shared by all rows, so repeated values
+    (statuses, operator classes, cities, dates...) are held once. ``LicenseRecord`` objects are only created
+    when a row is accessed.
+    """
+
+    def __init__(self) -> None:
+        self._tables: dict[str, StringTable] = {field: StringTable() for field in LicenseRecord._fields}
+        self._columns: dict[str, array.array[int]] = {field: array.array('I') for field in LicenseRecord._fields}
+        self._row_by_usi: dict[str, int] = {}
+        self._frozen = False
+        self._encoders = [(self._columns[field].append, self._tables[field].encode) for field in LicenseRecord._fields]
+
+    @classmethod
+    def from_records(cls, records: Iterable[tuple[str, LicenseRecord]]) -> LicenseRecordStore:
+        store = cls()
+        for usi, record in records:
+            store.add(usi, record)
+        store.freeze()
+        return store
+
+    def add(self, usi: str, record: LicenseRecord) -> None:
+        if self._frozen:
+            raise RuntimeError('store is frozen')
+        if usi in self._row_by_usi:
+            raise ValueError(f'duplicate system identifier {usi!r}')
+        self._row_by_usi[usi] = len(self._row_by_usi)
+        for (append, encode), value in zip(self._encoders, record):
+            append(encode(value))
+
+    def freeze(self) -> None:
+        for field, table in self._tables.items():
+            # call signs stay indexed for by_call_sign lookups
+            table.freeze(keep_index=field == 'call_sign')
+        self._frozen = True
+        self._encoders = []
+
+    def row(self, index: int) -> LicenseRecord:
+        return LicenseRecord(
+            *(self._tables[field].values[self._columns[field][index]] for field in LicenseRecord._fields)  # type: ignore[arg-type]
+        )
+
+    def __getitem__(self, usi: str) -> LicenseRecord:
+        return self.row(self._row_by_usi[usi])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._row_by_usi)
+
+    def __len__(self) -> int:
+        return len(self._row_by_usi)
+
+    def by_call_sign(self) -> CallSignIndex:
+        """
+        Group rows by call sign, like ``records_by_call_sign``, without creating any records up front.
+        """
+        if not self._frozen:
+            raise RuntimeError('store must be frozen first')
+        return CallSignIndex(self)
+
+
+class CallSignIndex(Mapping[str, list[LicenseRecord]]):
+    """
+    Call sign -> records mapping over a ``LicenseRecordStore``, ordered like ``records_by_call_sign`` output.
+
+    Rows are kept in one array sorted by call sign code (codes are assigned in order of first appearance)
+    with an offset per call sign, rather than a Python list per call sign.
+    """
+
+    def __init__(self, store: LicenseRecordStore) -> None:
+        self._store = store
+        self._table = store._tables['call_sign']
+        codes = store._columns['call_sign']
+        counts = array.array('I', bytes(4 * len(self._table)))
+        for code in codes:
+            counts[code] += 1
+        offsets = array.array('I', [0])
+        for count in counts:
+            offsets.append(offsets[-1] + count)
+        rows = array.array('I', bytes(4 * len(codes)))
+        next_slot = array.array('I', offsets[:-1])
+        for row_index, code in enumerate(codes):
+            rows[next_slot[code]] = row_index
+            next_slot[code] += 1
+        self._offsets = offsets
+        self._rows = rows
+
+    def _records(self, code: int) -> list[LicenseRecord]:
+        start, end = self._offsets[code], self._offsets[code + 1]
+        return [self._store.row(row_index) for row_index in self._rows[start:end]]
+
+    def __getitem__(self, call_sign: str) -> list[LicenseRecord]:
+        code = self._table.code_of(call_sign)
+        if code is None:
+            raise KeyError(call_sign)
+        return self._records(code)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._table.values)  # type: ignore[arg-type]
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+
+def to_record_store(raw_records: dict[str, dict[str, dict[str, Any]]]) -> LicenseRecordStore:
+    """
+    Compact equivalent of ``to_license_records``: records are encoded into the store as they are converted.
+    """
+    return LicenseRecordStore.from_records(iter_license_records(raw_records))
@@ -1,61 +1,347 @@
+import array
+import base64
 import logging
 import os
+import pathlib
 import queue
+import random
 import threading
+import time
+from typing import Any
+from typing import NamedTuple
 from typing import Type
 from typing import TYPE_CHECKING
 
+from . import compression
+from .journal import UploadJournal
+
 
 class STOP:
     ...
 
 
+class PendingUpload(NamedTuple):
+    """
+    An object to upload straight from memory, with the hex MD5 of its body for integrity checks and,
+    when the hash manifest uses another algorithm, the digest to record in the upload journal.
+    ``content_encoding`` is set when the body is compressed.
+    """
+
+    key: str
+    body: bytes
+    md5: str
+    digest: str | None = None
+    content_type: str | None = None
+    content_encoding: str | None = None
+
+
+def object_headers(key: str, content_type: str | None = None, content_encoding: str | None = None) -> dict[str, str]:
+    """
+    The ``ContentType`` (guessed from ``key`` if not given) and ``ContentEncoding`` arguments of an upload.
+    """
+    headers = {'ContentType': content_type or compression.content_type(key)}
+    if content_encoding is not None:
+        headers['ContentEncoding'] = content_encoding
+    return headers
+
+
+class _Retry(NamedTuple):
+    item: str | PendingUpload
+    attempt: int
+
+
+# S3 error codes (and HTTP statuses) that mean "slow down" rather than a problem with the request
+THROTTLING_ERRORS = {'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded', '503', '429'}
+
+
+def _is_throttling(error: Exception) -> bool:
+    response: dict[str, Any] = getattr(error, 'response', None) or {}
+    code = response.get('Error', {}).get('Code')
+    status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return code in THROTTLING_ERRORS or str(status) in THROTTLING_ERRORS
+
+
+class UploadStats:
+    """
+    Thread-safe throughput, latency and retry counters for an upload run.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.objects = 0
+        self.bytes = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.latencies: array.array[float] = array.array('d')
+        # latencies and throttling since the last call to ``take_window``, for the concurrency controller
+        self._window_latencies: list[float] = []
+        self._window_throttled = 0
+
+    def record_success(self, latency: float, size: int) -> None:
+        with self._lock:
+            self.objects += 1
+            self.bytes += size
+            self.latencies.append(latency)
+            self._window_latencies.append(latency)
+
+    def record_retry(self, throttled: bool) -> None:
+        with self._lock:
+            self.retries += 1
+            if throttled:
+                self.throttled += 1
+                self._window_throttled += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+    def take_window(self) -> tuple[list[float], int]:
+        with self._lock:
+            window = self._window_latencies, self._window_throttled
+            self._window_latencies = []
+            self._window_throttled = 0
+        return window
+
+    @staticmethod
+    def percentile(values: list[float], fraction: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self) -> dict[str, float]:
+        with self._lock:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            latencies = list(self.latencies)
+            return {
+                'objects': self.objects,
+                'bytes': self.bytes,
+                'objects_per_second': self.objects / elapsed,
+                'bytes_per_second': self.bytes / elapsed,
+                'p50_latency': self.percentile(latencies, 0.5),
+                'p99_latency': self.percentile(latencies, 0.99),
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'failures': self.failures,
+            }
+
+    def report(self) -> str:
+        s = self.summary()
+        return (
+            f'{s["objects"]:.0f} objects ({s["objects_per_second"]:.1f}/s, {s["bytes_per_second"] / 1024:.1f} KiB/s) '
+            f'p50={s["p50_latency"] * 1000:.0f}ms p99={s["p99_latency"] * 1000:.0f}ms '
+            f'retries={s["retries"]:.0f} throttled={s["throttled"]:.0f} failures={s["failures"]:.0f}'
+        )
+
+
 class Uploader:
+    """
+    Uploads build output to S3 from a pool of worker threads.
+
+    The pool starts at ``num_workers`` threads. Every ``adjust_interval`` seconds it is halved when S3
+    throttled requests, or grown by ``grow_step`` threads while uploads are waiting in the queue and latency
+    stays within ``latency_tolerance`` of the best observed median, between ``min_workers`` and
+    ``max_workers``. Failed uploads are re-queued with jittered exponential backoff and only reported in
+    ``upload_errors`` after ``max_retries`` retries.
+
+    With a ``journal``, every ``PendingUpload`` is recorded in it once S3 has confirmed it. Files queued by
+    key are uploaded with ``content_encoding``, for a local mirror holding compressed objects.
+    """
+
     def __init__(
-        self, rootdir: str, bucket_name: str, num_workers: int = 32, _dry_run: bool = False, quiet: int = 0
+        self,
+        rootdir: str,
+        bucket_name: str,
+        num_workers: int = 32,
+        _dry_run: bool = False,
+        quiet: int = 0,
+        min_workers: int = 4,
+        max_workers: int = 128,
+        adaptive: bool = True,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 30.0,
+        adjust_interval: float = 2.0,
+        grow_step: int = 4,
+        latency_tolerance: float = 1.5,
+        journal: UploadJournal | None = None,
+        endpoint_url: str | None = None,
+        content_encoding: str | None = None,
     ) -> None:
         self.rootdir: str = rootdir
-        self.queue: queue.Queue[str | Type[STOP]] = queue.Queue(maxsize=num_workers * 4)
+        self.max_workers = max(max_workers, num_workers)
+        self.min_workers = min(min_workers, num_workers)
+        self.queue: queue.Queue[str | PendingUpload | _Retry | Type[STOP]] = queue.Queue(maxsize=self.max_workers * 4)
         self._dry_run = _dry_run
         self.bucket_name = bucket_name
         self.num_workers = num_workers
-        self.workers = []
+        self.workers: list[threading.Thread] = []
         self.upload_errors: list[tuple[str, str]] = []
         self.quiet = quiet
-        for _ in range(num_workers):
+        self.stats = UploadStats()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.adjust_interval = adjust_interval
+        self.grow_step = grow_step
+        self.latency_tolerance = latency_tolerance
+        self.journal = journal
+        self.endpoint_url = endpoint_url
+        self.content_encoding = content_encoding
+        self._lock = threading.Lock()
+        self._target_workers = num_workers
+        self._best_latency: float | None = None
+        self._pending_retries = 0
+        self._retries_done = threading.Condition(self._lock)
+        self._stopping = threading.Event()
+        with self._lock:
+            self._spawn_workers()
+        self._controller: threading.Thread | None = None
+        if adaptive:
+            self._controller = threading.Thread(target=self._control, daemon=True)
+            self._controller.start()
+
+    def queue_upload(self, item: str | PendingUpload) -> None:
+        """
+        Queue the file at ``rootdir / key``, or a ``PendingUpload`` held in memory, for upload.
+        """
+        self.queue.put(item)
+
+    @property
+    def target_workers(self) -> int:
+        return self._target_workers
+
+    def _spawn_workers(self) -> None:
+        # must hold self._lock
+        while len(self.workers) < self._target_workers:
             worker = threading.Thread(target=self.worker)
-            worker.start()
             self.workers.append(worker)
+            worker.start()
+
+    def _should_retire(self) -> bool:
+        with self._lock:
+            if not self._stopping.is_set() and len(self.workers) > self._target_workers:
+                self.workers.remove(threading.current_thread())
+                return True
+        return False
 
-    def queue_upload(self, key: str) -> None:
-        self.queue.put(key)
+    def _control(self) -> None:
+        while not self._stopping.wait(self.adjust_interval):
+            latencies, throttled = self.stats.take_window()
+            with self._lock:
+                if self._stopping.is_set():
+                    return
+                if throttled:
+                    self._target_workers = max(self.min_workers, self._target_workers // 2)
+                elif latencies:
+                    median = UploadStats.percentile(latencies, 0.5)
+                    if self._best_latency is None or median < self._best_latency:
+                        self._best_latency = median
+                    # items still waiting in the queue mean no worker was free to take them
+                    saturated = self.queue.qsize() > 0
+                    if saturated and median <= self._best_latency * self.latency_tolerance:
+                        self._target_workers = min(self.max_workers, self._target_workers + self.grow_step)
+                    elif median > self._best_latency * self.latency_tolerance * 2:
+                        self._target_workers = max(self.min_workers, self._target_workers - self.grow_step)
+                self._spawn_workers()
+            logging.info(f'upload workers: {self._target_workers} ({self.stats.report()})')
+
+    def _requeue(self, item: str | PendingUpload, attempt: int) -> None:
+        try:
+            self.queue.put(_Retry(item, attempt))
+        finally:
+            with self._retries_done:
+                self._pending_retries -= 1
+                self._retries_done.notify_all()
+
+    def _upload(self, client: Any, item: str | PendingUpload) -> int:
+        """
+        Upload one item and return its size in bytes.
+        """
+        if isinstance(item, PendingUpload):
+            logging.info(f'Uploading {len(item.body)} bytes to s3://{self.bucket_name}/{item.key}')
+            if not self._dry_run:
+                response = client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=item.key,
+                    Body=item.body,
+                    ContentMD5=base64.b64encode(bytes.fromhex(item.md5)).decode('ascii'),
+                    **object_headers(item.key, item.content_type, item.content_encoding),
+                )
+                etag = response['ETag'].strip('"')
+                if etag != item.md5:
+                    # expected with SSE-KMS, where the ETag is not the MD5; S3 already checked Content-MD5
+                    logging.warning(f'ETag {etag} of {item.key} does not match MD5 {item.md5}')
+            return len(item.body)
+        local_path = os.path.join(self.rootdir, item)
+        logging.info(f'Uploading {local_path} to s3://{self.bucket_name}/{item}')
+        if self._dry_run:
+            return 0  # dry runs do not write the files either
+        extra_args = object_headers(item, content_encoding=self.content_encoding)
+        client.upload_file(local_path, self.bucket_name, item, ExtraArgs=extra_args)
+        return os.path.getsize(local_path)
 
     def worker(self) -> None:
         import boto3
         from botocore.config import Config
 
-        c = Config(retries={'max_attempts': 10, 'mode': 'standard'})
+        # few attempts inside botocore, so throttling reaches the concurrency controller
+        c = Config(retries={'max_attempts': 3, 'mode': 'standard'})
         session = boto3.Session()
-        client = session.client('s3', config=c)
+        client = session.client('s3', config=c, endpoint_url=self.endpoint_url)
         while True:
-            key = self.queue.get()
-            if key is STOP:
+            queued = self.queue.get()
+            if queued is STOP:
                 self.queue.task_done()
                 return
             if TYPE_CHECKING:
-                assert isinstance(key, str)
-            local_path = os.path.join(self.rootdir, key)
-            logging.info(f'Uploading {local_path} to s3://{self.bucket_name}/{key}')
-            if not self._dry_run:
-                try:
-                    client.upload_file(local_path, self.bucket_name, key)
-                except Exception as e:
-                    logging.error(f'Problem uploading file {local_path}', exc_info=True)
-                    self.upload_errors.append((local_path, str(e)))
+                assert isinstance(queued, (str, PendingUpload, _Retry))
+            item, attempt = queued if isinstance(queued, _Retry) else (queued, 0)
+            start = time.monotonic()
+            try:
+                size = self._upload(client, item)
+            except Exception as e:
+                throttled = _is_throttling(e)
+                name = item.key if isinstance(item, PendingUpload) else os.path.join(self.rootdir, item)
+                if attempt < self.max_retries:
+                    self.stats.record_retry(throttled)
+                    delay = min(self.backoff_cap, self.backoff_base * 2**attempt) * random.uniform(0.5, 1.0)
+                    logging.warning(f'Retrying {name} in {delay:.1f}s after {type(e).__name__}: {e}')
+                    with self._lock:
+                        self._pending_retries += 1
+                    timer = threading.Timer(delay, self._requeue, args=(item, attempt + 1))
+                    timer.daemon = True
+                    timer.start()
+                else:
+                    self.stats.record_failure()
+                    logging.error(f'Problem uploading {name}', exc_info=True)
+                    self.upload_errors.append((name, str(e)))
+            else:
+                self.stats.record_success(time.monotonic() - start, size)
+                if self.journal is not None and isinstance(item, PendingUpload) and not self._dry_run:
+                    self.journal.record(pathlib.PurePosixPath(item.key).stem, item.digest or item.md5)
             self.queue.task_done()
+            if self._should_retire():
+                return
 
     def join(self) -> None:
-        for _ in range(self.num_workers):
+        # wait until nothing is queued or waiting out a backoff, so every retry gets its turn
+        while True:
+            self.queue.join()
+            with self._retries_done:
+                if self._pending_retries == 0:
+                    break
+                self._retries_done.wait()
+        self._stopping.set()
+        if self._controller is not None:
+            self._controller.join()
+        with self._lock:
+            workers = list(self.workers)
+        for _ in workers:
             self.queue.put_nowait(STOP)
-        for worker in self.workers:
+        for worker in workers:
             worker.join()
+        if self.quiet < 2:
+            print(f'uploaded {self.stats.report()}')
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import itertools
+import os
+import pathlib
+import re
+import string
+from typing import Iterable
+from typing import Iterator
+from typing import Mapping
+from typing import Sequence
+
+from .constants import MORSE_TABLE
+from .constants import SYLLABLE_LENGTHS
+from .constants import UNAVAILABLE_PATTERNS
+from .hashing import HashManifest
+
+
+class UnavailableMatcher:
+    """
+    Tests call signs against all of ``patterns`` with a single compiled regex.
+
+    Each pattern becomes a named alternative of one anchored alternation (unanchored patterns get a lazy
+    ``.*?`` in front), so one ``match`` call finds the first pattern, in list order, that ``re.search``
+    would match; ``rule`` returns its index.
+    """
+
+    def __init__(self, patterns: Sequence[str] = UNAVAILABLE_PATTERNS) -> None:
+        self.patterns = list(patterns)
+        alternatives = []
+        for index, pattern in enumerate(self.patterns):
+            if not pattern.startswith('^'):
+                pattern = f'(?s:.*?){pattern}'
+            alternatives.append(f'(?P<rule{index}>{pattern})')
+        self._match = re.compile('|'.join(alternatives)).match
+
+    def rule(self, call_sign: str) -> int | None:
+        """
+        The index of the first pattern matching ``call_sign``, or ``None`` if it is not excluded.
+        """
+        match = self._match(call_sign)
+        if match is None:
+            return None
+        return int(match.lastgroup[4:])  # type: ignore[index]
+
+    def is_available(self, call_sign: str) -> bool:
+        return self._match(call_sign) is None
+
+    def classify(self, candidates: Iterable[str]) -> Iterator[tuple[str, int | None]]:
+        """
+        Yield each candidate with the index of the pattern excluding it, or ``None``.
+        """
+        match = self._match
+        for candidate in candidates:
+            found = match(candidate)
+            yield candidate, (int(found.lastgroup[4:]) if found is not None else None)  # type: ignore[index]
+
+    def excluded(self, candidates: Iterable[str]) -> dict[str, int]:
+        """
+        The excluded candidates, mapped to the index of the pattern excluding each.
+        """
+        return {candidate: rule for candidate, rule in self.classify(candidates) if rule is not None}
+
+    def available(self, candidates: Iterable[str]) -> Iterator[str]:
+        match = self._match
+        return (candidate for candidate in candidates if match(candidate) is None)
+
+
+UNAVAILABLE_MATCHER = UnavailableMatcher()
+
+
+# prefix and suffix lengths of the vanity call sign formats
+FORMATS = {'1x2': (1, 2), '1x3': (1, 3), '2x1': (2, 1), '2x2': (2, 2), '2x3': (2, 3)}
+
+# US amateur prefixes of each length; UNAVAILABLE_PATTERNS removes the ones a format cannot use
+PREFIXES = {
+    1: ['K', 'N', 'W'],
+    2: [f'A{c}' for c in 'ABCDEFGHIJKL'] + [f'{first}{c}' for first in 'KNW' for c in string.ascii_uppercase],
+}
+
+# per-character weights of the rankings; a call sign's score is the sum over its characters
+RANKINGS: dict[str, Mapping[str, int]] = {
+    'syllables': SYLLABLE_LENGTHS,
+    # the length of ``call_sign_morse``: each code plus the space after it, less the final space
+    'morse': {c: len(code) + 1 for c, code in MORSE_TABLE.items()},
+}
+_RANKING_OFFSET = {'syllables': 0, 'morse': -1}
+
+_LETTER_VALUES = {c: i for i, c in enumerate(string.ascii_uppercase, start=1)}
+_CALL_SIGN_PARTS = re.compile(r'([A-Z]{1,2})(\d)([A-Z]{1,3})')
+# prefixes and suffixes are read as base-27 numbers with A=1, so shorter ones never collide with longer ones
+_SUFFIX_SPACE = 27**3
+_SPACE = 27**2 * 10 * _SUFFIX_SPACE
+
+
+def _letters_value(letters: str) -> int:
+    value = 0
+    for c in letters:
+        value = value * 27 + _LETTER_VALUES[c]
+    return value
+
+
+def encode_call_sign(call_sign: str) -> int | None:
+    """
+    A dense integer for a call sign of one or two letters, a digit and one to three letters, else ``None``.
+    """
+    match = _CALL_SIGN_PARTS.fullmatch(call_sign)
+    if match is None:
+        return None
+    prefix, digit, suffix = match.groups()
+    return (_letters_value(prefix) * 10 + int(digit)) * _SUFFIX_SPACE + _letters_value(suffix)
+
+
+class AssignedCallSigns:
+    """
+    A bitset over the integers of ``encode_call_sign``, marking the call signs that are taken.
+    Call signs of any other shape are ignored, since no vanity format can produce them.
+    """
+
+    def __init__(self) -> None:
+        self._bits = bytearray((_SPACE + 7) // 8)
+        self.count = 0
+
+    def add(self, call_sign: str) -> None:
+        code = encode_call_sign(call_sign)
+        if code is None:
+            return
+        byte, bit = divmod(code, 8)
+        if not self._bits[byte] >> bit & 1:
+            self._bits[byte] |= 1 << bit
+            self.count += 1
+
+    def contains_code(self, code: int) -> bool:
+        return bool(self._bits[code >> 3] >> (code & 7) & 1)
+
+    def __contains__(self, call_sign: object) -> bool:
+        code = encode_call_sign(call_sign) if isinstance(call_sign, str) else None
+        return code is not None and self.contains_code(code)
+
+    def __len__(self) -> int:
+        return self.count
+
+    @classmethod
+    def from_call_signs(cls, call_signs: Iterable[str]) -> AssignedCallSigns:
+        """
+        E.g. from the keys of ``records_by_call_sign``.
+        """
+        assigned = cls()
+        for call_sign in call_signs:
+            assigned.add(call_sign)
+        return assigned
+
+    @classmethod
+    def from_build(cls, rootdir: str | pathlib.Path = '_build') -> AssignedCallSigns:
+        """
+        The call signs published by ``build``, read from the call sign keys of its hash manifest.
+        """
+        return cls.from_call_signs(HashManifest.load(os.path.join(rootdir, 'hashes.bin')).hashes)
+
+
+def _group_by_score(items: Iterable[str], weights: Mapping[str, int]) -> dict[int, list[str]]:
+    groups: dict[int, list[str]] = {}
+    for item in items:
+        groups.setdefault(sum(weights[c] for c in item), []).append(item)
+    return groups
+
+
+def iter_available(
+    assigned: AssignedCallSigns,
+    formats: Iterable[str] = FORMATS,
+    regions: Iterable[str] = string.digits,
+    rank: str | None = 'syllables',
+    matcher: UnavailableMatcher | None = None,
+) -> Iterator[tuple[str, int]]:
+    """
+    Yield ``(call sign, score)`` for every call sign of ``formats`` in the ``regions`` (call sign digits)
+    that is neither in ``assigned`` nor excluded by ``matcher``, lowest ``rank`` score first.
+
+    Scores are sums of per-character weights (``RANKINGS``), so candidates are generated one score at a
+    time from prefixes, digits and suffixes grouped by their partial scores. Nothing but those groups is
+    held in memory, and ``itertools.islice`` over the generator only does the work for what it takes.
+    With ``rank=None`` all scores are 0 and candidates come in format order.
+    """
+    if matcher is None:
+        matcher = UNAVAILABLE_MATCHER
+    weights = RANKINGS[rank] if rank is not None else dict.fromkeys(MORSE_TABLE, 0)
+    offset = _RANKING_OFFSET[rank] if rank is not None else 0
+    digits = _group_by_score(regions, weights)
+    plans: list[tuple[dict[int, list[str]], dict[int, list[tuple[str, int]]]]] = []
+    for format_name in formats:
+        prefix_length, suffix_length = FORMATS[format_name]
+        all_suffixes = itertools.product(string.ascii_uppercase, repeat=suffix_length)
+        suffixes = {
+            suffix_score: [(suffix, _letters_value(suffix)) for suffix in group]
+            for suffix_score, group in _group_by_score(map(''.join, all_suffixes), weights).items()
+        }
+        plans.append((_group_by_score(PREFIXES[prefix_length], weights), suffixes))
+    scores = sorted({a + b + c for prefixes, suffixes in plans for a in prefixes for b in digits for c in suffixes})
+    is_available = matcher.is_available
+    contains_code = assigned.contains_code
+    for score in scores:
+        for prefixes, suffixes in plans:
+            for prefix_score, prefix_group in prefixes.items():
+                for digit_score, digit_group in digits.items():
+                    suffix_group = suffixes.get(score - prefix_score - digit_score)
+                    if suffix_group is None:
+                        continue
+                    for prefix in prefix_group:
+                        prefix_value = _letters_value(prefix) * 10
+                        for digit in digit_group:
+                            base = (prefix_value + int(digit)) * _SUFFIX_SPACE
+                            for suffix, suffix_value in suffix_group:
+                                if contains_code(base + suffix_value):
+                                    continue
+                                call_sign = f'{prefix}{digit}{suffix}'
+                                if is_available(call_sign):
+                                    yield call_sign, score + offset
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description='list vanity call signs that are neither assigned nor excluded')
+    parser.add_argument('--rootdir', default='_build', help='output directory of a build')
+    parser.add_argument('--format', dest='formats', action='append', choices=list(FORMATS))
+    parser.add_argument('--region', dest='regions', action='append', choices=list(string.digits))
+    parser.add_argument('--rank', choices=list(RANKINGS), default='syllables')
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+    assigned = AssignedCallSigns.from_build(args.rootdir)
+    available = iter_available(
+        assigned, formats=args.formats or FORMATS, regions=args.regions or string.digits, rank=args.rank
+    )
+    for call_sign, score in itertools.islice(available, args.limit):
+        print(call_sign, score)
+
+
+if __name__ == '__main__':
+    main()